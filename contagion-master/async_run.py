@@ -0,0 +1,181 @@
+"""Run contagion simulations inside an asyncio event loop.
+Population.step is synchronous and can take a long time on a large
+grid, so stepping it directly from a coroutine would block every
+other task on the loop.  Here the steps are run in chunks on an
+executor (a thread pool by default), and each day is delivered to
+the caller as a Tick through an async generator.
+
+Between the simulation and the consumer there is a bounded queue of
+chunks.  When it is full the simulation waits, so a slow consumer
+slows the simulation down rather than letting days pile up.  Each
+simulation is stepped by one executor job at a time, so any number
+of simulations can share one loop and one executor.
+
+Usage:  python3 async_run.py contagion.ini --runs 4
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+import config
+import headless
+import model
+import mvc
+import termination
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Days stepped per executor job, and chunks the simulation
+# may run ahead of its consumer
+CHUNK = 10
+BUFFER = 2
+
+# Marks the end of the queue of chunks
+_DONE = object()
+
+
+class Tick:
+    """One day of a simulation: counts in Health order, and the
+    cells that changed state that day as (index, old, new), or
+    None if the population does not report changes.
+    """
+    __slots__ = ("day", "counts", "changes")
+
+    def __init__(self, day: int, counts: List[int],
+                 changes: Optional[List[Tuple[int, model.Health, model.Health]]]):
+        self.day = day
+        self.counts = counts
+        self.changes = changes
+
+
+class _Changes(mvc.BatchListener):
+    """Collects state changes until they are taken"""
+    __slots__ = ("changes",)
+
+    def __init__(self):
+        self.changes = []
+
+    def notify_batch(self, subject: object, event: str, batch: list):
+        self.changes.extend(batch)
+
+    def take(self) -> list:
+        changes, self.changes = self.changes, []
+        return changes
+
+
+async def ticks(population, chunk: int = CHUNK, buffer: int = BUFFER,
+                executor: Optional[concurrent.futures.Executor] = None,
+                deltas: bool = True,
+                until: Optional[termination.Termination] = None
+                ) -> AsyncIterator[Tick]:
+    """Seed the population and evolve it until a termination
+    criterion is met (by default, until nobody is contagious),
+    yielding a Tick for each day.  Days are
+    computed chunk at a time on executor (None: the loop's default
+    executor), at most buffer chunks ahead of the consumer.
+    The population must not be touched by anyone else until
+    the generator finishes or is closed.  A chunk already
+    running on the executor can't be stopped, so closing the
+    generator waits for it to finish.
+    """
+    loop = asyncio.get_running_loop()
+    changes = None
+    if deltas and hasattr(population, "events"):
+        changes = _Changes()
+        population.events.subscribe("newstate", changes)
+    series = headless.simulate(population, until=until)
+
+    def advance() -> List[Tick]:
+        """Next chunk of days; runs on the executor"""
+        return [Tick(day, counts, changes.take() if changes else None)
+                for day, counts in itertools.islice(series, chunk)]
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+    # The executor job stepping the population, if any
+    running: Optional[asyncio.Future] = None
+
+    async def produce():
+        nonlocal running
+        try:
+            while True:
+                running = loop.run_in_executor(executor, advance)
+                # Shielded: cancelling the producer must not
+                # forget a job that is still stepping
+                days = await asyncio.shield(running)
+                if not days:
+                    break
+                await queue.put(days)
+            await queue.put(_DONE)
+        except Exception as error:
+            await queue.put(error)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            days = await queue.get()
+            if days is _DONE:
+                break
+            if isinstance(days, Exception):
+                raise days
+            for tick in days:
+                yield tick
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+        if running is not None:
+            await asyncio.gather(running, return_exceptions=True)
+        if changes:
+            population.events.unsubscribe("newstate", changes)
+
+
+async def run_one(rows: int, cols: int, seed: int,
+                  executor: Optional[concurrent.futures.Executor] = None
+                  ) -> Tuple[int, List[int]]:
+    """Final (day, counts) of one seeded run"""
+    loop = asyncio.get_running_loop()
+    population = await loop.run_in_executor(
+        executor, model.Population, rows, cols, True, seed)
+    last = None
+    async for tick in ticks(population, executor=executor, deltas=False):
+        last = tick
+    return last.day, last.counts
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Concurrent contagion runs on one event loop")
+    parser.add_argument("conf", nargs="?", default="contagion.ini")
+    parser.add_argument("--runs", type=int, default=4)
+    parser.add_argument("--first-seed", type=int, default=0)
+    return parser.parse_args()
+
+
+async def run_all(rows: int, cols: int, seeds: range):
+    results = await asyncio.gather(*(run_one(rows, cols, seed) for seed in seeds))
+    for seed, (day, counts) in zip(seeds, results):
+        log.info(f"Seed {seed}: quiescent on day {day}, counts {counts}")
+
+
+def main():
+    args = cli()
+    config.configure(args.conf)
+    rows = config.get_int("Grid", "Rows")
+    cols = config.get_int("Grid", "Cols")
+    seeds = range(args.first_seed, args.first_seed + args.runs)
+    start = time.perf_counter()
+    asyncio.run(run_all(rows, cols, seeds))
+    print(f"{len(seeds)} runs in {time.perf_counter() - start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Benchmarks of the object model and its views.
+Times Population construction, Population.neighbors, Population.step
+(frontier and full sweep), count_in_state, and drawing a full grid
+with GridView and RasterView, on a range of grid sizes.  Results are
+written as JSON along with a description of the machine, and can be
+compared with an earlier result file (the 'baseline'): any benchmark
+slower than the baseline by more than the threshold is reported as a
+regression, and the exit status is 1.
+
+Grids are given as a configuration file (tiny.ini) or as RxC, which
+uses the parameters of contagion.ini on an R by C grid.  The view
+benchmarks need a display and are skipped without one.
+
+Usage:
+    python3 benchmarks.py --output bench.json
+    python3 benchmarks.py --grids tiny.ini 100x100 --baseline bench.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import config
+import model
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+GRIDS = ["tiny.ini", "minimal.ini", "contagion.ini", "300x300", "1000x1000"]
+BASE_CONF = "contagion.ini"
+SEED = 0
+
+# Days stepped per timing of step
+STEP_DAYS = 5
+# Calls per timing of neighbors and count_in_state
+CALLS = 1000
+# One cell in this many is infected at the start, so that every
+# grid has an outbreak the size of which scales with the grid
+OUTBREAK = 97
+# Full sweeps are slow on big grids; skip them beyond this many cells
+MAX_SWEEP_CELLS = 300 * 300
+
+
+def configure(grid: str) -> str:
+    """Load the configuration for grid; returns its label RxC"""
+    if grid.endswith(".ini"):
+        config.configure(grid)
+    else:
+        rows, cols = grid.lower().split("x")
+        config.configure(BASE_CONF)
+        config.override("Grid", "Rows", rows)
+        config.override("Grid", "Cols", cols)
+    return f"{config.get_int('Grid', 'Rows')}x{config.get_int('Grid', 'Cols')}"
+
+
+def timed(run: Callable[[], object], setup: Callable[[], object] = None,
+          repeat: int = 3) -> List[float]:
+    """Seconds for each of repeat calls of run(setup())"""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            run(arg)
+        else:
+            run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def population(rows: int, cols: int, frontier: bool = True,
+               days: int = 0) -> model.Population:
+    """A seeded population, days into its outbreak"""
+    result = model.Population(rows, cols, frontier=frontier, run_seed=SEED)
+    result.seed()
+    for index in range(0, rows * cols, OUTBREAK):
+        result.visit(divmod(index, cols)).infect()
+    for _ in range(days):
+        result.step()
+    return result
+
+
+def steps(pop: model.Population):
+    for _ in range(STEP_DAYS):
+        pop.step()
+
+
+def neighbor_calls(pop: model.Population):
+    params = pop.kind_params("Typical")
+    rows, cols = pop.nrows, pop.ncols
+    for i in range(CALLS):
+        pop.neighbors(params.N_Neighbors, i % rows, (i * 7) % cols,
+                      params.Visit_Dist)
+
+
+def count_calls(pop: model.Population):
+    states = list(model.Health)
+    for i in range(CALLS):
+        pop.count_in_state(states[i % len(states)])
+
+
+def display_available() -> bool:
+    try:
+        import graphics.graphics   # Opens a Tk root window
+    except Exception as error:     # tkinter.TclError without a display
+        log.info(f"No display, skipping view benchmarks ({error})")
+        return False
+    return True
+
+
+def view_benchmarks(rows: int, cols: int, repeat: int) -> Dict[str, List[float]]:
+    import contagion
+    import grid_view
+    width = config.get_int("Grid", "Width")
+    height = config.get_int("Grid", "Height")
+    pop = population(rows, cols)
+    colors = list(grid_view.STATE_COLORS.values())
+    results = {}
+
+    if rows * cols <= contagion.MAX_CELL_ITEMS:
+        def draw_cells(view):
+            for row in range(rows):
+                for col in range(cols):
+                    view.fill_cell(row, col, colors[(row + col) % len(colors)])
+            view.update()
+            view.win.close()
+        results["gridview_fill_update"] = timed(
+            draw_cells,
+            lambda: grid_view.GridView(width, height, rows, cols),
+            repeat)
+
+    batch = [(index, model.Health.vulnerable, list(model.Health)[index % 5])
+             for index in range(rows * cols)]
+
+    def draw_raster(view):
+        view.notify_batch(pop, "newstate", batch)
+        view.update()
+        view.close()
+    results["rasterview_update"] = timed(
+        draw_raster,
+        lambda: grid_view.RasterView(width, height, rows, cols),
+        repeat)
+    return results
+
+
+def run_benchmarks(grids: List[str], repeat: int = 3) -> List[dict]:
+    """Timings of every benchmark on every grid"""
+    show = display_available()
+    results = []
+    for grid in grids:
+        label = configure(grid)
+        rows, cols = config.get_int("Grid", "Rows"), config.get_int("Grid", "Cols")
+        log.info(f"Grid {label}")
+        timings = {
+            "construct": timed(lambda: model.Population(rows, cols, run_seed=SEED),
+                               repeat=repeat),
+            "neighbors": timed(neighbor_calls, lambda: population(rows, cols),
+                               repeat),
+            "step_frontier": timed(steps, lambda: population(rows, cols, days=10),
+                                   repeat),
+            "count_in_state": timed(count_calls, lambda: population(rows, cols),
+                                    repeat),
+        }
+        if rows * cols <= MAX_SWEEP_CELLS:
+            timings["step_sweep"] = timed(
+                steps, lambda: population(rows, cols, frontier=False, days=10),
+                repeat)
+        if show:
+            timings.update(view_benchmarks(rows, cols, repeat))
+        per_call = {"neighbors": CALLS, "count_in_state": CALLS,
+                    "step_frontier": STEP_DAYS, "step_sweep": STEP_DAYS}
+        for name, times in timings.items():
+            calls = per_call.get(name, 1)
+            results.append({"name": name, "grid": label, "calls": calls,
+                            "best": min(times) / calls,
+                            "median": statistics.median(times) / calls,
+                            "repeat": len(times)})
+            log.info(f"  {name:22} {min(times) / calls:11.3e} s")
+    return results
+
+
+def machine() -> dict:
+    """Where and on what these results were measured"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results: List[dict], baseline: List[dict],
+            threshold: float) -> List[str]:
+    """Descriptions of benchmarks slower than baseline by more than
+    threshold (a fraction).  Best times are compared, as the least
+    disturbed by other activity on the machine.
+    """
+    before = {(r["name"], r["grid"]): r["best"] for r in baseline}
+    regressions = []
+    for result in results:
+        old = before.get((result["name"], result["grid"]))
+        if not old:
+            continue
+        change = result["best"] / old - 1
+        line = (f"{result['name']:22} {result['grid']:>10} "
+                f"{old:11.3e} -> {result['best']:11.3e} s  {change:+7.1%}")
+        if change > threshold:
+            regressions.append(line)
+            print(line + "  REGRESSION")
+        else:
+            print(line)
+    return regressions
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the contagion model and views")
+    parser.add_argument("--grids", nargs="+", default=GRIDS,
+                        help="Configuration files or RxC sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmarks.json")
+    parser.add_argument("--baseline", default=None,
+                        help="Earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Slowdown that counts as a regression (0.10: 10%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    results = run_benchmarks(args.grids, args.repeat)
+    with open(args.output, "w") as out:
+        json.dump({"machine": machine(), "results": results}, out, indent=1)
+    print(f"{len(results)} benchmarks written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as src:
+            baseline = json.load(src)
+        if baseline["machine"]["platform"] != platform.platform():
+            log.warning("Baseline was measured on another platform: "
+                        f"{baseline['machine']['platform']}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
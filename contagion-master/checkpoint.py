@@ -0,0 +1,209 @@
+"""Save and restore a Population part way through a run.
+A checkpoint is taken between days.  At that point nobody has a
+state change pending, so a population is fully described by
+
+  - the grid size, run seed, day and scheduling mode,
+  - for each cell: kind, state, time in state, and for an AtRisk
+    individual the cell it will visit again (-1 for none) and the
+    last day it was stepped (see model.AtRisk),
+  - the neighbor table.
+
+Random numbers are keyed by seed, day and cell (see streams.py), so
+there is no generator state to save: a restored population continues
+exactly as the original would have.  The configuration is not saved,
+only a hash of it and the seed (see config_hash); resume with the
+same configuration file, or loading fails.
+
+A lazy population (see model.Population, sparse or not) is saved
+as records: state, time in state and return visit for the
+individuals that have been made, and the neighbor lists that have
+been drawn.  It is restored lazy (and sparse if it was), with
+everyone else rebuilt from the seed and configuration when needed.
+An eager population is saved cell by cell.
+
+Layout (little-endian): a fixed header, then one array per field.
+Kinds and states take a byte per cell (or individual), the
+others 4 bytes.
+The file is written to a temporary name and renamed into place,
+so a run killed while saving leaves the previous checkpoint intact.
+"""
+
+from array import array
+import hashlib
+import json
+import os
+import struct
+import sys
+from typing import BinaryIO
+
+import config
+import model
+import neighbors
+import streams
+
+MAGIC = b"CTGN"
+VERSION = 5
+
+# magic, version, rows, cols, seed, day, frontier, lazy, sparse,
+# configuration hash
+HEADER = struct.Struct("<4sHIIQqBBB8s")
+
+
+def _write_array(out: BinaryIO, values: array):
+    """Length, then the values"""
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    out.write(struct.pack("<Q", len(values)))
+    out.write(values.tobytes())
+
+
+def _read_array(src: BinaryIO, typecode: str) -> array:
+    length, = struct.unpack("<Q", src.read(8))
+    values = array(typecode)
+    values.frombytes(src.read(length * values.itemsize))
+    if len(values) != length:
+        raise ValueError("Checkpoint is truncated")
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def config_hash(seed: int) -> bytes:
+    """Hash of the current configuration and seed, which
+    decide the kind and parameters of every individual
+    """
+    description = {"config": config.resolved(), "seed": seed}
+    text = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).digest()[:8]
+
+
+def _last_step(individual: model.Individual) -> int:
+    """Last day an AtRisk individual was stepped (-1 for others)"""
+    if isinstance(individual, model.AtRisk):
+        return individual.last_step
+    return -1
+
+
+def _save_records(population: model.Population, out: BinaryIO):
+    ncols = population.ncols
+    cells = array("i", population.made())
+    states = array("B")
+    times = array("i")
+    prior_visits = array("i")
+    last_steps = array("i")
+    for index in cells:
+        individual = population.touched(index)
+        states.append(individual.state)
+        times.append(individual._time_in_state)
+        visit = individual.prior_visit
+        prior_visits.append(-1 if visit is None
+                            else visit.row * ncols + visit.col)
+        last_steps.append(_last_step(individual))
+    table = population.neighbor_table
+    drawn = table.drawn()
+    lists = neighbors.NeighborTable(population.nrows, ncols)
+    for index in drawn:
+        lists.append(table.neighbors(index))
+    for values in [cells, states, times, prior_visits, last_steps,
+                   array("i", drawn), lists.offsets, lists.indices]:
+        _write_array(out, values)
+
+
+def _load_records(src: BinaryIO, rows: int, cols: int, frontier: bool,
+                  seed: int, day: int, sparse: bool) -> model.Population:
+    cells = _read_array(src, "i")
+    states = _read_array(src, "B")
+    times = _read_array(src, "i")
+    prior_visits = _read_array(src, "i")
+    last_steps = _read_array(src, "i")
+    drawn = _read_array(src, "i")
+    lists = neighbors.NeighborTable(rows, cols)
+    lists.offsets = _read_array(src, "i")
+    lists.indices = _read_array(src, "i")
+    return model.Population.restore_records(
+        rows, cols, frontier, seed, day, cells,
+        [model.Health(state) for state in states], times, prior_visits,
+        last_steps, {index: lists.neighbors(i) for i, index in enumerate(drawn)},
+        sparse)
+
+
+def _save_dense(population: model.Population, out: BinaryIO):
+    kind_codes = {kind: code for code, kind in enumerate(model.KINDS)}
+    ncols = population.ncols
+    kinds = array("B")
+    states = array("B")
+    times = array("i")
+    prior_visits = array("i")
+    last_steps = array("i")
+    for index in range(population.nrows * ncols):
+        individual = population.touched(index)
+        if individual is None:
+            # Never touched (see Population): vulnerable since day 0
+            kinds.append(kind_codes[population.kind_of(index)])
+            states.append(model.Health.vulnerable)
+            times.append(0)
+            prior_visits.append(-1)
+            last_steps.append(-1)
+            continue
+        kinds.append(kind_codes[individual.kind])
+        states.append(individual.state)
+        times.append(individual._time_in_state)
+        visit = individual.prior_visit
+        prior_visits.append(-1 if visit is None
+                            else visit.row * ncols + visit.col)
+        last_steps.append(_last_step(individual))
+    table = population.neighbor_table.csr()
+    for values in [kinds, states, times, prior_visits, last_steps,
+                   table.offsets, table.indices]:
+        _write_array(out, values)
+
+
+def save(population: model.Population, path: str):
+    """Write population to path, replacing any earlier checkpoint"""
+    temp = path + ".tmp"
+    seed = population.rng.seed & streams.MASK
+    with open(temp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION,
+                              population.nrows, population.ncols, seed,
+                              population.day, population.frontier,
+                              population.lazy, population.sparse,
+                              config_hash(seed)))
+        if population.lazy:
+            _save_records(population, out)
+        else:
+            _save_dense(population, out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp, path)
+
+
+def load(path: str) -> model.Population:
+    """The population saved in path"""
+    with open(path, "rb") as src:
+        magic, version, rows, cols, seed, day, frontier, lazy, sparse, \
+            saved_hash = HEADER.unpack(src.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a contagion checkpoint")
+        if version != VERSION:
+            raise ValueError(f"{path} is checkpoint version {version}, "
+                             f"expected {VERSION}")
+        if saved_hash != config_hash(seed):
+            raise ValueError(f"{path} was saved with a different "
+                             "configuration")
+        if lazy:
+            return _load_records(src, rows, cols, bool(frontier),
+                                 seed, day, bool(sparse))
+        kinds = _read_array(src, "B")
+        states = _read_array(src, "B")
+        times = _read_array(src, "i")
+        prior_visits = _read_array(src, "i")
+        last_steps = _read_array(src, "i")
+        table = neighbors.NeighborTable(rows, cols)
+        table.offsets = _read_array(src, "i")
+        table.indices = _read_array(src, "i")
+    return model.Population.restore(
+        rows, cols, bool(frontier), seed, day,
+        [model.KINDS[code] for code in kinds],
+        [model.Health(state) for state in states],
+        times, prior_visits, last_steps, table)
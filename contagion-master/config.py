@@ -8,6 +8,7 @@ read a separate configuration file.
 """
 
 import configparser
+from typing import Dict
 
 import logging
 logging.basicConfig()
@@ -22,6 +23,28 @@ def configure(filename: str):
     log.info(f"Configuring from file {filename}")
     CONF.read_file(open(filename))
 
+def override(section: str, parameter: str, value: str):
+    """Replace one parameter of the configuration already read.
+    Setting a DEFAULT parameter changes it for every section
+    that does not set its own value.
+    """
+    assert CONF, "Must call configure first"
+    if section != CONF.default_section and not CONF.has_section(section):
+        raise KeyError(f"No section [{section}] in configuration")
+    if parameter not in CONF[section]:
+        raise KeyError(f"No parameter {parameter} in [{section}]")
+    CONF[section][parameter] = str(value)
+
+def resolved() -> Dict[str, Dict[str, str]]:
+    """Every parameter of every section, with DEFAULT values
+    filled in where a section does not set its own.
+    """
+    assert CONF, "Must call configure first"
+    result = {CONF.default_section: dict(CONF.defaults())}
+    for section in CONF.sections():
+        result[section] = dict(CONF[section])
+    return result
+
 def get_float(section: str, parameter: str) -> float:
     assert CONF, "Must call configure first"
     param_str = CONF[section][parameter]
@@ -1,10 +1,14 @@
 """Simple grid model of contagion"""
 
-import grid_view
-import change_listener
 import model
-import contagion_stats
+import headless
+import profiling
+import sinks
+import termination
+import tracing
 
+import signal
+import sys
 import time
 import config
 import argparse
@@ -23,72 +27,278 @@ def cli() -> object:
         description="Contagion, a simple model of disease spread")
     parser.add_argument("conf", nargs="?",
                         default="contagion.ini")
-    return parser.parse_args()
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without graphics at full speed")
+    parser.add_argument("--output", default=None,
+                        help="Daily counts file (default counts.csv "
+                             "for --headless runs, none otherwise)")
+    parser.add_argument("--format", choices=sorted(sinks.FORMATS),
+                        default=None,
+                        help="Format of the daily counts file "
+                             "(default: from its extension, else csv)")
+    parser.add_argument("--engine", choices=["objects", "numpy"],
+                        default="objects",
+                        help="Model engine (numpy requires --headless)")
+    parser.add_argument("--eager", action="store_true",
+                        help="Make every individual and neighbor list at startup")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Keep only individuals the outbreak has touched")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for a reproducible run")
+    parser.add_argument("--view", choices=["auto", "cells", "raster"],
+                        default="auto",
+                        help="Draw each cell, or the grid as one image "
+                             "(auto: image for grids over 200x200)")
+    parser.add_argument("--fps", type=float, default=20,
+                        help="Maximum display frames per second")
+    parser.add_argument("--steps-per-sec", type=float, default=0,
+                        help="Target simulation speed (0: as fast as possible)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Save the run to this file periodically "
+                             "(--headless only)")
+    parser.add_argument("--checkpoint-every", type=int, default=10,
+                        help="Epochs between checkpoints")
+    parser.add_argument("--resume", default=None,
+                        help="Continue the run saved in this checkpoint file "
+                             "(--headless only)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time each phase of the run and print a table "
+                             "per epoch (SIGUSR1 also switches it on or off)")
+    parser.add_argument("--trace", nargs="+", default=[], metavar="POINT",
+                        help="Trace points to record, as name or name:rate "
+                             f"({', '.join(tracing.POINTS)}, or all)")
+    parser.add_argument("--trace-output", default=None,
+                        help="File for traced events (default: standard error); "
+                             "SIGUSR2 also writes them during the run")
+    parser.add_argument("--max-days", type=int, default=None,
+                        help="Stop after this many days")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Stop after this much real time")
+    parser.add_argument("--plateau", type=int, default=None, metavar="DAYS",
+                        help="Stop when the counts have not changed for DAYS")
+    args = parser.parse_args()
+    for spec in args.trace:
+        if spec.partition(":")[0] not in list(tracing.POINTS) + ["all"]:
+            parser.error(f"No trace point {spec}")
+    if args.engine != "objects" and not args.headless:
+        parser.error("--engine numpy can only be used with --headless")
+    if (args.checkpoint or args.resume) and (
+            args.engine != "objects" or not args.headless):
+        parser.error("--checkpoint and --resume need --headless "
+                     "and --engine objects")
+    if args.sparse and (args.eager or args.engine != "objects"):
+        parser.error("--sparse needs --engine objects, and not --eager")
+    return args
 
 
 def main():
-    """View a simulation of contagion"""
+    """Run a simulation of contagion"""
     args = cli()
     config.configure(args.conf)
     n_rows = config.get_int("Grid", "rows")
     n_cols = config.get_int("Grid", "cols")
+    tracing.enable(args.trace)
+    if args.profile:
+        profiling.PROFILER.enable()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profiling.PROFILER.toggle)
+        signal.signal(signal.SIGUSR2,
+                      lambda *_: dump_trace(args.trace_output))
 
-    population = model.Population(n_rows, n_cols)
+    start = time.perf_counter()
+    if args.resume:
+        import checkpoint
+        population = checkpoint.load(args.resume)
+    elif args.engine == "numpy":
+        # NumPy is only needed for the array engine
+        import vector_model
+        population = vector_model.VectorPopulation(n_rows, n_cols,
+                                                   run_seed=args.seed)
+    else:
+        population = model.Population(n_rows, n_cols, run_seed=args.seed,
+                                      lazy=not args.eager,
+                                      sparse=args.sparse)
+    print(f"Population ready in {time.perf_counter() - start:.2f} seconds")
+    until = termination.termination(args.max_days, args.max_seconds,
+                                    args.plateau)
+    if args.headless:
+        run_headless(population, args.output or "counts.csv", args.format,
+                     until=until,
+                     resume=bool(args.resume),
+                     checkpoint_path=args.checkpoint,
+                     checkpoint_every=args.checkpoint_every)
+    else:
+        sink = args.output and sinks.open_sink(args.output, args.format)
+        run_graphics(population, args.view, sink=sink, until=until,
+                     fps=args.fps, steps_per_sec=args.steps_per_sec)
+    if args.trace:
+        dump_trace(args.trace_output)
+
+
+def dump_trace(path: str = None):
+    """Write (and clear) the traced events so far"""
+    if path:
+        with open(path, "a") as out:
+            tracing.dump(out)
+    else:
+        tracing.dump(sys.stderr)
+
+
+def run_headless(population, output: str, format: str = None,
+                 until: termination.Termination = None,
+                 resume: bool = False,
+                 checkpoint_path: str = None, checkpoint_every: int = 10):
+    """Evolve until a termination criterion is met (by default,
+    until nobody is contagious) with no view, no chart, and no
+    pauses, writing the count of individuals in each state on
+    each day.
+    With resume, continue a restored population, appending to
+    the output its days after the checkpoint.  With
+    checkpoint_path, save the population there every
+    checkpoint_every epochs.
+    """
+    on_epoch = None
+    if checkpoint_path:
+        import checkpoint
+
+        def on_epoch(day: int):
+            if day % (checkpoint_every * headless.EPOCH) == 0:
+                # The output must hold every day up to the checkpoint
+                sink.flush()
+                checkpoint.save(population, checkpoint_path)
+                log.info(f"Day {day} saved to {checkpoint_path}")
+    profiler = profiling.PROFILER
+    until = until or termination.termination()
+    start = time.perf_counter()
+    day = population.day if resume else 0
+    with sinks.open_sink(output, format,
+                         after=population.day if resume else None) as sink:
+        for day, _ in headless.simulate(population, resume=resume,
+                                        on_epoch=on_epoch, until=until):
+            phase_start = profiler.clock()
+            sink.write(sinks.record(population, day))
+            profiler.record("output", phase_start)
+            if day % headless.EPOCH == 0:
+                profiler.end_epoch(day // headless.EPOCH)
+    days = sink.rows_written
+    elapsed = time.perf_counter() - start
+    print(f"Stopped on day {day}: {until.reason}")
+    print(f"{days} days in {elapsed:.2f} seconds (seed {population.rng.seed}), "
+          f"counts written to {output}")
+    report_profile(day // headless.EPOCH + 1)
+
+
+def report_profile(epoch: int):
+    """Per-epoch timing table, if we were profiling"""
+    profiler = profiling.PROFILER
+    profiler.end_epoch(epoch)
+    if profiler.epochs:
+        print(profiler.table())
+
+
+# Beyond this many cells, drawing one canvas item per cell is too slow
+MAX_CELL_ITEMS = 200 * 200
+
+
+class Pacer:
+    """Hold a loop to a target rate (no limit if rate is 0)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.perf_counter()
+
+    def wait(self):
+        if not self.interval:
+            return
+        self.next_time += self.interval
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Fell behind; don't try to catch up
+            self.next_time = time.perf_counter()
+
+
+def run_graphics(population: model.Population, view_kind: str = "auto",
+                 sink: sinks.Sink = None,
+                 until: termination.Termination = None,
+                 fps: float = 20, steps_per_sec: float = 0):
+    """View a simulation of contagion, until a termination
+    criterion is met (by default, until nobody is contagious).
+    The simulation advances as fast as it can (or at steps_per_sec),
+    independent of drawing.  The view is redrawn at most fps times
+    per second, and shows all the changes since the last frame.
+    """
+    # Graphics modules open a Tk root window on import, so we
+    # import them only when we are going to display something
+    import grid_view
+    import contagion_stats
+    n_rows = population.nrows
+    n_cols = population.ncols
 
     # View of the main model
-    view = grid_view.GridView(config.get_int("Grid", "Width"),
-                              config.get_int("Grid", "Height"),
-                              nrows=n_rows, ncols=n_cols,
-                              title="Contagion", autoflush=False)
+    if view_kind == "auto":
+        view_kind = "raster" if n_rows * n_cols > MAX_CELL_ITEMS else "cells"
+    view_class = grid_view.RasterView if view_kind == "raster" else grid_view.GridView
+    view = view_class(config.get_int("Grid", "Width"),
+                      config.get_int("Grid", "Height"),
+                      nrows=n_rows, ncols=n_cols,
+                      title="Contagion", autoflush=False)
 
     # Summary statistics
-    stats_view = contagion_stats.Stats(population)
-
-    # Monitor changes to cells ---
-    #    - for monitoring progress
-    #    - for updating the main view
-    monitor = change_listener.ChangeListener()
-    # Attach listeners to each cell
-    for row in range(n_rows):
-        for col in range(n_cols):
-            cell_view = grid_view.CellView(row, col, view)
-            population.cells[row][col].add_listener(cell_view)  # Graphics
-            population.cells[row][col].add_listener(monitor)    # Change tracking
-        view.update(rate=5)
+    stats_view = contagion_stats.Stats(population, sink)
+
+    # The main view follows changes to cells
+    population.events.subscribe("newstate", view)
 
     # Initial view, before simulation starts
     view.update()
     time.sleep(1)
     log.info("Seeding")
-    population.seed()  # Note this should set change monitor
+    population.seed()
+    stats_view.update(day=0)
     view.update()
     time.sleep(1)
 
-    # Evolve until it reaches quiescence
+    # Evolve until we are told to stop, which is checked every
+    # day.  We chart each 'epoch' of 10 steps rather than each step
     log.info("Running")
+    until = until or termination.termination()
     steps = 0
     epoch = 0
-    monitor.set(True)
-    while monitor.check():
-        monitor.set(False)  # No changes yet in this cycle
-        # An 'epoch' is 10 steps.  We stop when an epoch has
-        # gone by without a noticeable state change, and we
-        # chart each epoch rather than each step
-        for _ in range(10):
-            steps += 1
-            log.debug(f"Step {steps}")
-            population.step()
-            view.update()
-            stats_view.update(day=steps)
-            time.sleep(0.1)
+    pacer = Pacer(steps_per_sec)
+    profiler = profiling.PROFILER
+    while not until.check(steps, headless.daily_counts(population)):
+        steps += 1
+        log.debug(f"Step {steps}")
+        population.step()
+        start = profiler.clock()
+        stats_view.update(day=steps)
+        start = profiler.record("stats", start)
+        view.update(rate=fps)
+        start = profiler.record("render", start)
+        pacer.wait()
+        profiler.record("pace", start)
+        if steps % headless.EPOCH == 0:
+            epoch += 1
+            # Print stats and update bar graph after each epoch
+            start = profiler.clock()
+            stats_view.show(day=steps, epoch=epoch)
+            profiler.record("chart", start)
+            profiler.end_epoch(epoch)
+    if steps % headless.EPOCH:
+        # Last, partial epoch
         epoch += 1
-
-        # Print stats and update bar graph after each epoch
         stats_view.show(day=steps, epoch=epoch)
+    print(f"Stopped on day {steps}: {until.reason}")
 
-    # Simulation is no longer changing.  Leave view open
-    # until the user presses enter
+    # Simulation is no longer changing.  Show the final state
+    # and leave view open until the user presses enter
+    view.update()
     stats_view.show_summary()
+    if sink:
+        sink.close()
+    report_profile(epoch + 1)
     _ = input("Press enter to close")
 
 
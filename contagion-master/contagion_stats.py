@@ -5,10 +5,15 @@ contagion model.
 import model
 import config
 import bar_chart
+import sinks
+from typing import Optional
 
 class Stats:
-    def __init__(self, population: model.Population):
+    def __init__(self, population: model.Population,
+                 sink: Optional[sinks.Sink] = None):
         self.pop = population
+        # Daily counts go to the sink, if we have one
+        self.sink = sink
         # Accompanying chart of current cases and total deaths
         chart_width = config.get_int("Chart", "Width")
         chart_height = config.get_int("Chart", "Height")
@@ -40,6 +45,8 @@ class Stats:
             self.max_symptomatic = current_cases
             self.max_symptomatic_day = day
         self.prior_day_dead = deaths
+        if self.sink:
+            self.sink.write(sinks.record(self.pop, day))
 
     def show(self, day: int, epoch: int):
         current_cases = self.pop.count_in_state(model.Health.symptomatic)
@@ -58,6 +65,8 @@ class Stats:
         print(f"Peak {self.max_symptomatic} symptomatic " +
               f"on day {self.max_symptomatic_day}")
         print(f"Peak {self.max_period_dead} deaths on day {self.max_deaths_day}")
+        if self.sink:
+            self.sink.flush()
 
 
 
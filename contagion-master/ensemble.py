@@ -0,0 +1,162 @@
+"""Monte Carlo ensembles of contagion runs.
+One run of the model is one random sample.  To see the spread of
+possible outcomes for a configuration we run it many times with
+different seeds, in parallel worker processes, and summarize the
+daily symptomatic and dead counts as mean and percentile curves.
+
+Usage:  python3 ensemble.py contagion.ini --runs 100 --output bands.csv
+"""
+
+import argparse
+import concurrent.futures
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import config
+import model
+import result_cache
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Series we keep from each run
+SERIES = [model.Health.symptomatic, model.Health.dead]
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+class Run:
+    """Daily counts from one seeded run"""
+
+    def __init__(self, seed: int, series: Dict[model.Health, List[int]]):
+        self.seed = seed
+        self.series = series
+
+    @property
+    def days(self) -> int:
+        return len(self.series[SERIES[0]])
+
+
+def run_one(conf: str, seed: int, engine: str = "objects",
+            cache: Optional[str] = None) -> Run:
+    """Run a single headless simulation to quiescence, or fetch
+    its results from the cache directory if given.
+    Executed in a worker process, so it configures itself.
+    """
+    config.configure(conf)
+    if cache:
+        daily = result_cache.ResultCache(cache).series(seed, engine)
+    else:
+        daily = result_cache.simulate(seed, engine)
+    series = {state: [] for state in SERIES}
+    columns = [list(model.Health).index(state) for state in SERIES]
+    for _, counts in daily:
+        for state, column in zip(SERIES, columns):
+            series[state].append(counts[column])
+    return Run(seed, series)
+
+
+def run_ensemble(conf: str, seeds: Sequence[int],
+                 workers: Optional[int] = None,
+                 engine: str = "objects",
+                 cache: Optional[str] = None) -> Iterator[Run]:
+    """Run one simulation per seed over a process pool,
+    yielding each run as soon as it finishes (not in seed order).
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_one, conf, seed, engine, cache) for seed in seeds]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    """pct percentile of an ordered list, interpolating
+    linearly between the two nearest values.
+    """
+    position = (len(ordered) - 1) * pct / 100.0
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class Ensemble:
+    """Accumulates runs and summarizes them day by day.
+    Runs end on different days; a run that has stopped is
+    quiescent, so its last counts carry forward.
+    """
+
+    def __init__(self):
+        self.runs: List[Run] = []
+
+    def add(self, run: Run):
+        self.runs.append(run)
+
+    def days(self) -> int:
+        return max(run.days for run in self.runs)
+
+    def summary(self, state: model.Health) -> List[Tuple[float, List[float]]]:
+        """For each day, (mean, [percentiles]) of the count in state"""
+        result = []
+        for day in range(self.days()):
+            values = sorted(run.series[state][min(day, run.days - 1)]
+                            for run in self.runs)
+            mean = sum(values) / len(values)
+            result.append((mean, [percentile(values, p) for p in PERCENTILES]))
+        return result
+
+    def write(self, out):
+        """Summary curves as comma-separated values, one line per day"""
+        header = ["day"]
+        for state in SERIES:
+            header.append(f"{state}_mean")
+            header.extend(f"{state}_p{p}" for p in PERCENTILES)
+        print(",".join(header), file=out)
+        summaries = [self.summary(state) for state in SERIES]
+        for day in range(self.days()):
+            fields = [str(day)]
+            for summary in summaries:
+                mean, pcts = summary[day]
+                fields.append(f"{mean:.2f}")
+                fields.extend(f"{v:.2f}" for v in pcts)
+            print(",".join(fields), file=out)
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Ensemble of contagion runs with confidence bands")
+    parser.add_argument("conf", nargs="?", default="contagion.ini")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="Number of seeds to run")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--engine", choices=["objects", "numpy"],
+                        default="objects")
+    parser.add_argument("--output", default="ensemble.csv")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="Reuse results of identical runs stored in DIR")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    seeds = range(args.first_seed, args.first_seed + args.runs)
+    ensemble = Ensemble()
+    start = time.perf_counter()
+    for run in run_ensemble(args.conf, seeds, args.workers,
+                            args.engine, args.cache):
+        ensemble.add(run)
+        peak = max(run.series[model.Health.symptomatic])
+        dead = run.series[model.Health.dead][-1]
+        log.info(f"Seed {run.seed}: {run.days} days, peak {peak} symptomatic, "
+                 f"{dead} dead ({len(ensemble.runs)}/{len(seeds)})")
+    with open(args.output, "w") as out:
+        ensemble.write(out)
+    elapsed = time.perf_counter() - start
+    print(f"{len(seeds)} runs in {elapsed:.1f} seconds, "
+          f"summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 """
 A simple grid view of the disease state of a population.
-Each cell can have its own view object, responsible for updating
-the depiction of that cell.  The view object knows about the
-position of the cell in the grid.
+The view listens for batches of state changes from the
+population, and recolors each cell that changed.
+
+Each cell is one canvas item, created when the view is built
+and recolored in place, so the canvas does not accumulate a new
+rectangle for every state change.  Recoloring is deferred to the
+next update, so a cell that changes several times between updates
+is recolored once.
 """
 
 import graphics.grid
+import time
+from typing import Dict
 from graphics.graphics import color_rgb
 import mvc
 import model
@@ -22,8 +29,17 @@ STATE_COLORS = {
     model.Health.dead: color_rgb(0, 0, 0)
 }
 
+# Which state a pixel shows when it stands for several cells, from
+# least to most important: contagious cells stay visible however
+# far the grid is scaled down
+PRECEDENCE = [model.Health.vulnerable, model.Health.recovered,
+              model.Health.dead, model.Health.asymptomatic,
+              model.Health.symptomatic]
+# Rank of each state in PRECEDENCE; rank 0 is 'not yet drawn'
+RANKS = {state: rank + 1 for rank, state in enumerate(PRECEDENCE)}
 
-class GridView(graphics.grid.Grid):
+
+class GridView(graphics.grid.Grid, mvc.BatchListener):
     def __init__(self, width: int, height: int,
                  nrows: int, ncols: int, title: str = "Untitled",
                  background = graphics.graphics.color_rgb(255, 255, 255),
@@ -32,23 +48,51 @@ class GridView(graphics.grid.Grid):
         super().__init__(width, height,
                  nrows, ncols, title,
                  background, autoflush)
-
-class CellView(mvc.Listener):
-    """View of one cell in the grid"""
-
-    def __init__(self, row: int, col: int, grid_view: GridView):
-        self.row = row
-        self.col = col
-        self.grid_view = grid_view
-
-    def notify(self, subject: mvc.Listenable, event: str):
-        """Update view of this cell. """
-        assert isinstance(subject, model.Individual)  # because argument type is too general
+        self.ncols = ncols
+        # One canvas item per cell, in row-major order.  Cells are
+        # transparent (show the background) until first filled.
+        self._items = []
+        for row in range(nrows):
+            top = row * self.cell_height
+            bottom = (row + 1) * self.cell_height
+            for col in range(ncols):
+                left = col * self.cell_width
+                right = (col + 1) * self.cell_width
+                self._items.append(self.win.create_rectangle(
+                    left, top, right, bottom, fill="", outline=""))
+        # Cell index -> color, waiting for the next update
+        self._pending: Dict[int, str] = {}
+
+    def fill_cell(self, row: int, col: int, color,
+                  border_width=1,
+                  border_color=graphics.grid.GREY):
+        """Fill cell[row,col] with color at the next update.
+        Same arguments as graphics.grid.Grid.fill_cell; the border
+        is always the default.
+        """
+        self._pending[row * self.ncols + col] = color
+
+    def update(self, rate=None):
+        """Recolor changed cells, then update the display
+        (at most rate times per second, if rate is given).
+        """
+        if rate and time.time() < self._last_update + 1/rate:
+            return
+        itemconfig = self.win.itemconfig
+        for index, color in self._pending.items():
+            itemconfig(self._items[index], fill=color, outline=graphics.grid.GREY)
+        self._pending.clear()
+        super().update()
+
+    def notify_batch(self, subject: object, event: str, batch: list):
+        """Update view of each cell that changed state"""
+        assert isinstance(subject, model.Population)  # because argument type is too general
         if event == "newstate":
-            color = STATE_COLORS[subject.state]
-            self.grid_view.fill_cell(self.row, self.col, color)
+            for index, _, state in batch:
+                row, col = divmod(index, self.ncols)
+                self.fill_cell(row, col, STATE_COLORS[state])
         else:
-            log.warning(f"CellView does not handle event type '{event}'")
+            log.warning(f"GridView does not handle event type '{event}'")
 
 
 
@@ -58,3 +102,96 @@ class CellView(mvc.Listener):
 
 
 
+
+
+class RasterView(mvc.BatchListener):
+    """The whole grid as a single image, for grids too large
+    to draw as one canvas item per cell.  Each cell is a block
+    of pixels or, if the grid is larger than the window, each
+    pixel is a block of cells, showing the state that comes
+    last in PRECEDENCE among them.  Cell states are kept in a
+    buffer; on update, only rows of pixels that changed are
+    uploaded to the image.
+    Listens for batches of state changes like GridView.
+    """
+
+    def __init__(self, width: int, height: int,
+                 nrows: int, ncols: int, title: str = "Untitled",
+                 background = color_rgb(255, 255, 255),
+                 autoflush=False):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.win = graphics.graphics.GraphWin(title, width, height, autoflush=autoflush)
+        # Cells per pixel (blocks), or pixels per cell (cell sizes)
+        self.block_rows = -(-nrows // height)
+        self.block_cols = -(-ncols // width)
+        self.cell_height = max(1, height // nrows)
+        self.cell_width = max(1, width // ncols)
+        image_width = self.cell_width * -(-ncols // self.block_cols)
+        image_height = self.cell_height * -(-nrows // self.block_rows)
+        self.image = graphics.graphics.Image(
+            graphics.graphics.Point(image_width / 2, image_height / 2),
+            image_width, image_height)
+        self.image.draw(self.win)
+        self._palette = [background] + [STATE_COLORS[state] for state in PRECEDENCE]
+        self._ranks = bytearray(nrows * ncols)
+        # Rows of pixels (not cells) to upload
+        self._dirty_rows = set(range(image_height // self.cell_height))
+        self._last_update = 0.0
+
+    def notify_batch(self, subject: object, event: str, batch: list):
+        """Record new states of cells that changed state"""
+        assert isinstance(subject, model.Population)  # because argument type is too general
+        if event == "newstate":
+            span = self.ncols * self.block_rows
+            for index, _, state in batch:
+                self._ranks[index] = RANKS[state]
+                self._dirty_rows.add(index // span)
+        else:
+            log.warning(f"RasterView does not handle event type '{event}'")
+
+    def _row_ranks(self, row: int) -> bytes:
+        """Rank to show in each pixel of a row of pixels"""
+        ncols = self.ncols
+        first = row * self.block_rows
+        last = min(first + self.block_rows, self.nrows)
+        ranks = self._ranks[first * ncols:(first + 1) * ncols]
+        for cells in range(first + 1, last):
+            ranks = bytes(map(max, ranks, self._ranks[cells * ncols:(cells + 1) * ncols]))
+        step = self.block_cols
+        if step > 1:
+            ranks = bytes(max(ranks[col:col + step]) for col in range(0, ncols, step))
+        return ranks
+
+    def _row_pixels(self, row: int) -> str:
+        """Pixel data for one row of pixels (or of cells, each
+        cell_height pixels high), in PhotoImage.put format
+        """
+        palette = self._palette
+        line = "{" + " ".join(
+            palette[rank] for rank in self._row_ranks(row)
+            for _ in range(self.cell_width)) + "}"
+        return " ".join([line] * self.cell_height)
+
+    def update(self, rate=None):
+        """Upload changed rows, then update the display
+        (at most rate times per second, if rate is given).
+        """
+        if rate and time.time() < self._last_update + 1/rate:
+            return
+        # Upload each run of consecutive changed rows with one put
+        rows = sorted(self._dirty_rows)
+        self._dirty_rows.clear()
+        run_start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i] != rows[i - 1] + 1:
+                first = rows[run_start]
+                data = " ".join(self._row_pixels(row) for row in rows[run_start:i])
+                self.image.img.put(data, to=(0, first * self.cell_height))
+                run_start = i
+        self.win.update()
+        self._last_update = time.time()
+
+    def close(self):
+        """Close the window"""
+        self.win.close()
@@ -0,0 +1,60 @@
+"""Run a contagion model without graphics.
+Only the model is built (no grid view, no chart), and the
+simulation runs as fast as it can, recording how many
+individuals are in each state on each day.  This is what
+we use for batch runs on machines without a display.
+"""
+
+import model
+import termination
+
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.WARN)
+
+# Days per epoch (for checkpoints and per-epoch reports)
+EPOCH = 10
+
+
+def daily_counts(population: model.Population) -> List[int]:
+    """Number of individuals in each state, in Health order"""
+    counts = population.counts()
+    return [counts[state] for state in model.Health]
+
+
+def simulate(population: model.Population,
+             epoch: int = EPOCH, resume: bool = False,
+             on_epoch: Optional[Callable[[int], None]] = None,
+             until: Optional[termination.Termination] = None
+             ) -> Iterator[Tuple[int, List[int]]]:
+    """Seed the population and evolve it until a termination
+    criterion is met (by default, until nobody is contagious),
+    yielding (day, counts) for day 0 (just after seeding)
+    and for each following day, up to the day the run stops.
+
+    With resume=True the population is not seeded, and days
+    continue after population.day (a restored checkpoint, whose
+    own day was yielded by the run that saved it).
+    on_epoch(day) is called at the end of each epoch after
+    which the run goes on.
+    """
+    if until is None:
+        until = termination.termination()
+    if resume:
+        day = start = population.day
+    else:
+        population.seed()
+        day = start = 0
+    counts = daily_counts(population)
+    if not resume:
+        yield day, counts
+    while not until.check(day, counts):
+        if on_epoch and day % epoch == 0 and day > start:
+            on_epoch(day)
+        day += 1
+        population.step()
+        counts = daily_counts(population)
+        yield day, counts
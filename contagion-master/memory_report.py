@@ -0,0 +1,89 @@
+"""Report how much memory the object model uses per individual.
+Builds a Population from a configuration file (optionally with
+a different grid size) and measures the allocations with
+tracemalloc, so we can estimate how large a grid fits in memory.
+Populations are lazy unless --eager is given, so the neighbor
+table is measured as built: empty until lists are drawn.  With
+--days the outbreak is run that many days too, to see how memory
+grows with the number of individuals affected (--sparse keeps
+only those).
+"""
+
+import argparse
+import sys
+import tracemalloc
+
+import config
+import model
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.WARN)
+
+
+def measure(rows: int, cols: int, lazy: bool = True,
+            sparse: bool = False, days: int = 0) -> dict:
+    """Bytes allocated building a rows x cols Population (and
+    running it for days), in total and per individual, with a
+    rough breakdown.
+    """
+    # Load any modules construction imports before measuring
+    model.Population(1, 1, lazy=lazy, sparse=sparse)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    population = model.Population(rows, cols, lazy=lazy, sparse=sparse)
+    if days:
+        population.seed()
+        for _ in range(days):
+            population.step()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    n = rows * cols
+    made = population.materialized()
+    return {
+        "individuals": n,
+        "materialized": made,
+        "total": after - before,
+        "per_individual": (after - before) / n,
+        "per_materialized": (after - before) / max(made, 1),
+        "object": sys.getsizeof(population.visit((0, 0))),
+        "neighbor_table": population.neighbor_table.nbytes() / n,
+    }
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Memory used per individual in the contagion model")
+    parser.add_argument("conf", nargs="?", default="contagion.ini")
+    parser.add_argument("--rows", type=int, help="Override Grid Rows")
+    parser.add_argument("--cols", type=int, help="Override Grid Cols")
+    parser.add_argument("--eager", action="store_true",
+                        help="Make every individual and neighbor list up front")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Keep only individuals that have been touched")
+    parser.add_argument("--days", type=int, default=0,
+                        help="Days of outbreak to run before measuring")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    config.configure(args.conf)
+    rows = args.rows or config.get_int("Grid", "Rows")
+    cols = args.cols or config.get_int("Grid", "Cols")
+    if args.sparse and args.eager:
+        raise SystemExit("A population can't be both sparse and eager")
+    report = measure(rows, cols, lazy=not args.eager, sparse=args.sparse,
+                     days=args.days)
+    print(f"{rows}x{cols} grid, {report['individuals']} individuals, "
+          f"{report['materialized']} made after {args.days} days")
+    print(f"{report['total'] / 2**20:8.1f} MiB allocated")
+    print(f"{report['per_individual']:8.1f} bytes per individual")
+    print(f"{report['per_materialized']:8.1f} bytes per individual made")
+    print(f"{report['object']:8} bytes per Individual object")
+    print(f"{report['neighbor_table']:8.1f} bytes per individual in neighbor table")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,28 @@ January 24, 2023
 Project 3: Contagion
 Simple grid model of contagion
 '''
+import bisect
 import random
 import mvc  # for Listenable
 import enum
-from typing import List, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 import config
+import neighbors
+import profiling
+import streams
+import tracing
 import logging
 logging.basicConfig()
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logging.WARN)
 
 
 
-class Health(enum.Enum):
-    """Each individual is one discrete state of health"""
+class Health(enum.IntEnum):
+    """Each individual is one discrete state of health.
+    States are small integers, so comparing them is cheap.
+    """
     vulnerable = enum.auto()
     asymptomatic = enum.auto()
     symptomatic = enum.auto()
@@ -30,18 +37,44 @@ class Health(enum.Enum):
         return self.name
 
 
-class Individual(mvc.Listenable):
+# States in which an individual can infect others
+CONTAGIOUS = frozenset([Health.asymptomatic, Health.symptomatic])
+
+
+class KindParams:
+    """Configuration parameters for one kind of individual.
+    Read once per kind and shared by every individual of
+    that kind (a 'flyweight').
+    """
+    __slots__ = ("kind", "T_Incubate", "P_Transmit", "T_Recover", "P_Death",
+                 "P_Greet", "N_Neighbors", "P_Visit", "Visit_Dist")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.T_Incubate = config.get_int(kind, "T_Incubate")
+        self.P_Transmit = config.get_float(kind, "P_Transmit")
+        self.T_Recover = config.get_int(kind, "T_Recover")
+        self.P_Death = config.get_float(kind, "P_Death")
+        self.P_Greet = config.get_float(kind, "P_Greet")
+        self.N_Neighbors = config.get_int(kind, "N_Neighbors")
+        self.P_Visit = config.get_float(kind, "P_Visit")
+        self.Visit_Dist = config.get_int(kind, "Visit_Dist")
+
+
+class Individual:
     """An individual in the population,
     e.g., a person who might get and spread a disease.
-    The 'state' instance variable is public read-only, e.g.,
-    listeners can check it.
+    The 'state' instance variable is public read-only.
+    Changes of state are reported to the population, which
+    passes them on to listeners in one batch per time step.
+    Individuals are numerous, so they use __slots__ rather
+    than a per-object __dict__.
     """
+    __slots__ = ("region", "row", "col", "_time_in_state",
+                 "state", "next_state", "params", "prior_visit")
 
     def __init__(self, kind: str,
                  region: "Population", row: int, col: int):
-        # Listener needs its own initialization
-        super().__init__()
-        self.kind = kind
         self.region = region
         self.row = row
         self.col = col
@@ -50,34 +83,62 @@ class Individual(mvc.Listenable):
         self.state = Health.vulnerable
         self.next_state = Health.vulnerable
         # Configuration parameters based on kind
-        self.T_Incubate = config.get_int(kind, "T_Incubate")
-        self.P_Transmit = config.get_float(kind, "P_Transmit")
-        self.T_Recover = config.get_int(kind, "T_Recover")
-        self.P_Death = config.get_float(kind, "P_Death")
-        self.P_Greet = config.get_float(kind, "P_Greet")
-        self.N_Neighbors = config.get_int(kind, "N_Neighbors")
-        self.P_Visit = config.get_float(kind, "P_Visit")
-        self.Visit_Dist = config.get_int(kind, "Visit_Dist")
-        self.neighbors = region.neighbors(num=self.N_Neighbors,
-                                          row=row, col=col,
-                                          dist=self.Visit_Dist)
+        self.params = region.kind_params(kind)
         self.prior_visit = None
 
+    @property
+    def kind(self) -> str:
+        return self.params.kind
+
+    @property
+    def neighbors(self) -> List[Tuple[int, int]]:
+        """Addresses of the neighbors this individual may visit"""
+        ncols = self.region.ncols
+        return [divmod(index, ncols) for index in
+                self.region.neighbor_table.neighbors(self.row * ncols + self.col)]
+
+    def _random(self, draw: int) -> float:
+        """My random number for draw today (see streams.py)"""
+        region = self.region
+        return region.rng.uniform(region.day,
+                                  self.row * region.ncols + self.col, draw)
+
+    def _random_neighbor(self) -> Optional["Individual"]:
+        """One of my neighbors, chosen at random, or None if
+        I have none (e.g., N_Neighbors = 0, or a 1x1 grid)
+        """
+        region = self.region
+        here = self.row * region.ncols + self.col
+        choices = region.neighbor_table.neighbors(here)
+        if not choices:
+            return None
+        pick = region.rng.below(len(choices), region.day, here, streams.CHOOSE)
+        return region.visit(divmod(choices[pick], region.ncols))
+
+    def _is_neighbor(self, other: "Individual") -> bool:
+        """Is other one of my neighbors?"""
+        ncols = self.region.ncols
+        return self.region.neighbor_table.contains(
+            self.row * ncols + self.col, other.row * ncols + other.col)
+
     def step(self):
         """Next state"""
         # Basic state transitions are in common
         if self.state == Health.asymptomatic:
-            if self._time_in_state > self.T_Incubate:
+            if self._time_in_state > self.params.T_Incubate:
                 self.next_state = Health.symptomatic
-                log.debug("Becoming symptomatic")
+                if tracing.SYMPTOMATIC.enabled:
+                    tracing.SYMPTOMATIC.emit(self.region.day, self.row, self.col)
         if self.state == Health.symptomatic:
             # We could die on any time step before we recover
-            if self._time_in_state > self.T_Recover:
-                log.debug(f"Recovery at {self.row},{self.col}")
+            if self._time_in_state > self.params.T_Recover:
                 self.next_state = Health.recovered
-            elif random.random() < self.P_Death:
-                log.debug(f"Death at {self.row},{self.col}")
+                if tracing.RECOVERY.enabled:
+                    tracing.RECOVERY.emit(self.region.day, self.row, self.col)
+            elif self._random(streams.DEATH) < self.params.P_Death:
                 self.next_state = Health.dead
+                if tracing.DEATH.enabled:
+                    tracing.DEATH.emit(self.region.day, self.row, self.col)
 
         # Social behavior differs among concrete classes
         self.social_behavior()
@@ -86,8 +147,9 @@ class Individual(mvc.Listenable):
         """Time passes"""
         self._time_in_state += 1
         if self.state != self.next_state:
+            old_state = self.state
             self.state = self.next_state
-            self.notify_all("newstate")
+            self.region.state_changed(self, old_state)
             # Reset clock
             self._time_in_state = 0
 
@@ -97,25 +159,31 @@ class Individual(mvc.Listenable):
         """
         if self.state == Health.vulnerable:
             self.next_state = Health.asymptomatic
+            self.region.schedule(self)
 
     def social_behavior(self):
         raise NotImplementedError("Social behavior should be implemented in subclasses")
 
     def meet(self, other: "Individual"):
         """Two individuals meet.  Either may infect
-        the other.
+        the other.  The other is the visitor, and
+        the dice for the meeting are the visitor's.
         """
-        self.maybe_transmit(other)  # I might infect you
-        other.maybe_transmit(self)  # You might infect me
+        self.maybe_transmit(other, other, streams.HOST_TRANSMITS)  # I might infect you
+        other.maybe_transmit(self, other, streams.VISITOR_TRANSMITS)  # You might infect me
 
-    def maybe_transmit(self, other: "Individual"):
+    def maybe_transmit(self, other: "Individual",
+                       visitor: "Individual", draw: int):
         if not self._is_contagious():
             return
         if not other.state == Health.vulnerable:
             return
         # Transmission is possible.  Roll the dice
-        if random.random() < self.P_Transmit:
+        if visitor._random(draw) < self.params.P_Transmit:
             other.infect()
+            if tracing.TRANSMISSION.enabled:
+                tracing.TRANSMISSION.emit(self.region.day, self.row, self.col,
+                                          other.row, other.col)
 
     def _is_contagious(self) -> bool:
         """SARS COVID 19 apparently spreads before
@@ -129,104 +197,444 @@ class Individual(mvc.Listenable):
         raise NotImplementedError("Each class must implement 'hello'")
 
 
+# Kinds of individual, as given to Individual.__init__
+KINDS = ["Typical", "AtRisk", "Wanderer"]
+
+# Cells per chunk when kinds are counted without being stored
+KIND_CHUNK = 1 << 20
+
+
+def kind_thresholds(proportions: List[Tuple[object, float]]) -> List[Tuple[object, float]]:
+    """Kinds are assigned as if we tried each kind in turn, keeping
+    it with probability equal to its proportion, and started over
+    if none was kept.  Returns cumulative thresholds for a single
+    uniform draw with the same outcome probabilities.
+    """
+    chances = []
+    missed = 1.0
+    for kind, proportion in proportions:
+        chances.append((kind, missed * proportion))
+        missed *= 1.0 - proportion
+    total = sum(chance for _, chance in chances)
+    thresholds = []
+    cumulative = 0.0
+    for kind, chance in chances:
+        cumulative += chance / total
+        thresholds.append((kind, cumulative))
+    return thresholds
+
+
+class _KindDraws:
+    """Kind codes of a sparse population, in place of a stored
+    array: the code of a cell is worked out from its KIND draw
+    each time it is asked for.
+    """
+
+    def __init__(self, population: "Population"):
+        self.rng = population.rng
+        self.thresholds = [threshold for _, threshold in population._classes]
+        self.last = len(self.thresholds) - 1
+
+    def __getitem__(self, index: int) -> int:
+        dice = self.rng.uniform(streams.SETUP, index, streams.KIND)
+        return min(bisect.bisect_right(self.thresholds, dice), self.last)
+
+
 class Population(mvc.Listenable):
-    """Simple grid organization of individuals"""
+    """Simple grid organization of individuals.
+    Keeps running counts of individuals in each state (overall
+    and by kind), so counting does not require a pass over the grid.
+
+    With frontier=True (the default) each step visits only the
+    individuals that could change state: contagious individuals,
+    those who might visit them, and those with a state change
+    pending.  Nobody else can change state, so the outcome is the
+    same as stepping every individual, but the cost of a step is
+    proportional to the size of the outbreak rather than the grid.
+    Individuals that are not visited do not count time in state,
+    which matters only while contagious.  With frontier=False
+    every individual is stepped every day.
+
+    Random numbers come from streams.Streams for run_seed (a fresh
+    seed if not given), keyed by day and cell, so the same seed
+    gives the same run regardless of the order of stepping.
+    An AtRisk individual that was not stepped for some days
+    replays those days' visit draws when it is next stepped
+    (see AtRisk), so frontier and full-sweep runs of one seed
+    are identical, and identical to vector_model runs.
+
+    Listeners subscribe to 'newstate' events on Population.events,
+    and receive a list of (index, old state, new state) for each
+    time step (index is row * ncols + col).
+
+    Kinds are drawn for the whole grid at once.  With lazy=True
+    (the default) that is all construction does: an Individual
+    is made the first time it is touched (cells[row][col] is None
+    until then; use visit), and its neighbor list is drawn the
+    first time it is needed.  Draws are keyed by cell, so a lazy
+    population makes the same choices as an eager one.
+
+    With sparse=True nothing is stored per cell: kinds are counted
+    in a streaming pass and looked up by repeating a cell's KIND
+    draw, and individuals are kept in a dict by index as they are
+    made (cells is None).  Individuals are made when they are
+    stepped, that is when contagious, infected, or able to visit
+    someone contagious (whether or not they do), and when visited,
+    so memory grows with the outbreak and the neighborhoods of its
+    contagious cells rather than the grid.  Sparse populations are
+    lazy, and need frontier scheduling: a full sweep touches every
+    cell.
+    """
 
-    def __init__(self, rows: int, cols: int):
+    def __init__(self, rows: int, cols: int, frontier: bool = True,
+                 run_seed: Optional[int] = None, lazy: bool = True,
+                 sparse: bool = False):
+        if sparse and not frontier:
+            raise ValueError("A sparse population must step only the frontier")
+        self._setup(rows, cols, frontier, run_seed)
+        self.sparse = sparse
+        self.lazy = lazy or sparse
+        if sparse:
+            self._kinds = _KindDraws(self)
+            self.cells = None
+            kind_counts = self._count_kinds()
+        else:
+            self._kinds = self._kind_codes(0, rows * cols)
+            self.cells = [[None] * cols for _ in range(rows)]
+            kind_counts = [self._kinds.count(code)
+                           for code in range(len(self._kind_classes))]
+        for the_class, count in zip(self._kind_classes, kind_counts):
+            self._kind_counts[the_class.__name__][Health.vulnerable] = count
+        self._counts[Health.vulnerable] = rows * cols
+        if lazy or sparse:
+            max_dist = max(params.Visit_Dist for params in self._code_params)
+            self.neighbor_table = neighbors.LazyNeighborTable(
+                rows, cols, self._reach, max_dist, self.rng)
+            return
+        # Populate according to configuration
+        self.neighbor_table = neighbors.NeighborTable(rows, cols)
+        for index in range(rows * cols):
+            individual = self._individual(index)
+            params = individual.params
+            chosen = self.neighbor_table.sample(
+                individual.row, individual.col,
+                params.N_Neighbors, params.Visit_Dist, self.rng)
+            if tracing.NEIGHBORS.enabled:
+                tracing.NEIGHBORS.emit(individual.row, individual.col, chosen)
+            self.neighbor_table.append(chosen)
+
+    @classmethod
+    def restore(cls, rows: int, cols: int, frontier: bool, run_seed: int,
+                day: int, kinds: List[str], states: List[Health],
+                times: List[int], prior_visits: List[int],
+                last_steps: List[int],
+                neighbor_table: neighbors.NeighborTable) -> "Population":
+        """A population as it was at the start of day (see
+        checkpoint.py).  kinds, states, times in state, the
+        cell index of each pending return visit (-1 for none)
+        and the last day each AtRisk individual was stepped
+        are given per cell in row-major order.
+        """
+        population = cls.__new__(cls)
+        population._setup(rows, cols, frontier, run_seed)
+        population.day = day
+        population.neighbor_table = neighbor_table
+        classes = {"Typical": Typical, "AtRisk": AtRisk, "Wanderer": Wanderer}
+        population._kinds = None   # Every individual is made here
+        population.cells = []
+        for row_i in range(rows):
+            row = []
+            for col_i in range(cols):
+                index = row_i * cols + col_i
+                individual = classes[kinds[index]](population, row_i, col_i)
+                individual.state = individual.next_state = states[index]
+                individual._time_in_state = times[index]
+                if isinstance(individual, AtRisk):
+                    individual.last_step = last_steps[index]
+                population._counts[individual.state] += 1
+                population._kind_counts[individual.kind][individual.state] += 1
+                if individual.state in CONTAGIOUS:
+                    population._contagious.add(index)
+                row.append(individual)
+            population.cells.append(row)
+        for index, visit in enumerate(prior_visits):
+            if visit >= 0:
+                row_i, col_i = divmod(index, cols)
+                population.cells[row_i][col_i].prior_visit = \
+                    population.visit(divmod(visit, cols))
+        return population
+
+    @classmethod
+    def restore_records(cls, rows: int, cols: int, frontier: bool,
+                        run_seed: int, day: int, cells: List[int],
+                        states: List[Health], times: List[int],
+                        prior_visits: List[int], last_steps: List[int],
+                        lists: Dict[int, List[int]],
+                        sparse: bool = False) -> "Population":
+        """A lazy (or sparse) population as it was at the start
+        of day (see checkpoint.py).  Only the individuals that had
+        been made are given: states, times in state, pending return
+        visits (-1 for none) and last days stepped (AtRisk only) of
+        cells, and the neighbor lists that had been drawn, by
+        cell.  Everyone else is rebuilt from the seed when needed,
+        vulnerable as on day 0.
+        """
+        population = cls(rows, cols, frontier=frontier, run_seed=run_seed,
+                         sparse=sparse)
+        population.day = day
+        for index, state, time, last in zip(cells, states, times, last_steps):
+            individual = population._individual(index)
+            individual.state = individual.next_state = state
+            individual._time_in_state = time
+            if isinstance(individual, AtRisk):
+                individual.last_step = last
+            population._counts[Health.vulnerable] -= 1
+            population._counts[state] += 1
+            kind_counts = population._kind_counts[individual.kind]
+            kind_counts[Health.vulnerable] -= 1
+            kind_counts[state] += 1
+            if state in CONTAGIOUS:
+                population._contagious.add(index)
+        for index, visit in zip(cells, prior_visits):
+            if visit >= 0:
+                population._individual(index).prior_visit = \
+                    population._individual(visit)
+        for index, chosen in lists.items():
+            population.neighbor_table.keep(index, chosen)
+        return population
+
+    def _setup(self, rows: int, cols: int, frontier: bool,
+               run_seed: Optional[int]):
+        """Everything but the individuals and their neighbors"""
         super().__init__()
-        self.cells = []
         self.nrows = rows
         self.ncols = cols
-        # Populate according to configuration
-        for row_i in range(config.get_int("Grid", "Rows")):
-            row = []
-            for col_i in range(config.get_int("Grid", "Cols")):
-                row.append(self._random_individual(row_i, col_i))
-            self.cells.append(row)
-        return
+        self.rng = streams.Streams(run_seed, rows * cols)
+        self.day = 0
+        self.sparse = False
+        self.lazy = False
+        self._individuals: Dict[int, Individual] = {}
+        self._kind_params: Dict[str, KindParams] = {}
+        self._classes = kind_thresholds(
+            [(AtRisk, config.get_float("Grid", "Proportion_AtRisk")),
+             (Typical, config.get_float("Grid", "Proportion_Typical"))])
+        # Kinds of cells are stored as codes: index in _kind_classes
+        self._kind_classes = [the_class for the_class, _ in self._classes]
+        self._code_params = [self.kind_params(the_class.__name__)
+                             for the_class in self._kind_classes]
+        self._counts: Dict[Health, int] = {state: 0 for state in Health}
+        self._kind_counts: Dict[str, Dict[Health, int]] = {
+            kind: {state: 0 for state in Health} for kind in KINDS}
+        # Active-set scheduling: cell indices (row * ncols + col)
+        self.frontier = frontier
+        self._contagious: Set[int] = set()
+        self._pending: Set[int] = set()
+        # State changes since they were last published
+        self.events = mvc.EventBus()
+        self._changes: List[Tuple[int, Health, Health]] = []
 
     def seed(self):
         """patient zero"""
-        row = random.randint(0, self.nrows - 1)
-        col = random.randint(0, self.ncols - 1)
-        self.cells[row][col].infect()
-        self.cells[row][col].tick()
+        cell = self.rng.below(self.nrows * self.ncols,
+                              streams.SETUP, 0, streams.PATIENT_ZERO)
+        individual = self._individual(cell)
+        individual.infect()
+        individual.tick()
+        self._publish_changes()
 
     def step(self):
-        """Determine next states"""
+        """Determine next states.
+        Phases are timed by profiling.PROFILER when it is on.
+        """
         log.debug("Population: Step")
-        # Time passes
-        for row in self.cells:
-            for cell in row:
+        profiler = profiling.PROFILER
+        start = profiler.clock()
+        if self.frontier:
+            self._step_frontier(profiler, start)
+        else:
+            cells = [self._individual(index)
+                     for index in range(self.nrows * self.ncols)]
+            for cell in cells:
                 cell.step()
-        for row in self.cells:
-            for cell in row:
+            start = profiler.record("step", start, self.nrows * self.ncols)
+            # Time passes
+            for cell in cells:
                 cell.tick()
+            self._pending.clear()
+            profiler.record("tick", start, self.nrows * self.ncols)
+        self.day += 1
+        start = profiler.clock()
+        self._publish_changes()
         self.notify_all("timestep")
+        profiler.record("notify", start)
 
-    def count_in_state(self, state: Health) -> int:
-        """How many individuals are currently in state?"""
-        count = 0
-        for c in self.cells:
-            for i in c:
-                if i.state == state:
-                    count += 1
-        return count
-
-    def _random_individual(self, row: int, col: int) -> "Individual":
-        classes = [(AtRisk, config.get_float("Grid", "Proportion_AtRisk")),
-                   (Typical, config.get_float("Grid", "Proportion_Typical"))]
-        while True:
-            for the_class, proportion in classes:
-                dice = random.random()
-                if dice < proportion:
-                    return the_class(self, row, col)
+    def _publish_changes(self):
+        if self._changes:
+            changes, self._changes = self._changes, []
+            self.events.publish(self, "newstate", changes)
+
+    def _step_frontier(self, profiler: profiling.Profiler,
+                       start: Optional[float]):
+        """Step the individuals that could change state,
+        then tick them and anyone they infected.
+        """
+        visitors = self.neighbor_table.visitors
+        active = self._contagious | self._pending
+        for index in self._contagious:
+            active.update(visitors(index))
+        active = sorted(active)
+        start = profiler.record("frontier", start)
+        individual = self._individual
+        for index in active:
+            individual(index).step()
+        start = profiler.record("step", start, len(active))
+        # Time passes
+        ticking = self._pending.union(active)
+        self._pending.clear()
+        for index in ticking:
+            individual(index).tick()
+        profiler.record("tick", start, len(ticking))
+
+    def schedule(self, individual: Individual):
+        """Called by an individual with a state change pending"""
+        self._pending.add(individual.row * self.ncols + individual.col)
+
+    def kind_params(self, kind: str) -> KindParams:
+        """Parameters shared by all individuals of kind"""
+        if kind not in self._kind_params:
+            self._kind_params[kind] = KindParams(kind)
+        return self._kind_params[kind]
+
+    def state_changed(self, individual: Individual, old_state: Health):
+        """Called by an individual when its state changes,
+        to keep counts up to date.
+        """
+        self._counts[old_state] -= 1
+        self._counts[individual.state] += 1
+        by_kind = self._kind_counts[individual.kind]
+        by_kind[old_state] -= 1
+        by_kind[individual.state] += 1
+        index = individual.row * self.ncols + individual.col
+        if self.events.has_subscribers("newstate"):
+            self._changes.append((index, old_state, individual.state))
+        if (old_state in CONTAGIOUS) != (individual.state in CONTAGIOUS):
+            if individual.state in CONTAGIOUS:
+                self._contagious.add(index)
+            else:
+                self._contagious.discard(index)
+
+    def count_in_state(self, state: Health, kind: Optional[str] = None) -> int:
+        """How many individuals (of kind, if given) are currently in state?"""
+        if kind is None:
+            return self._counts[state]
+        return self._kind_counts[kind][state]
+
+    def counts(self) -> Dict[Health, int]:
+        """Current number of individuals in each state"""
+        return dict(self._counts)
+
+    def _kind_codes(self, start: int, stop: int) -> bytearray:
+        """Kind codes of cells start to stop, drawn in one pass
+        (with NumPy, if we have it).  A cell gets the first kind
+        whose threshold is above its KIND draw.
+        """
+        thresholds = [threshold for _, threshold in self._classes]
+        last = len(thresholds) - 1
+        try:
+            import numpy as np
+        except ImportError:
+            uniform = self.rng.uniform
+            return bytearray(
+                min(bisect.bisect_right(
+                    thresholds, uniform(streams.SETUP, index, streams.KIND)), last)
+                for index in range(start, stop))
+        dice = self.rng.uniforms(streams.SETUP, np.arange(start, stop),
+                                 streams.KIND)
+        codes = np.minimum(np.searchsorted(thresholds, dice, side="right"), last)
+        return bytearray(codes.astype(np.uint8).tobytes())
+
+    def _count_kinds(self) -> List[int]:
+        """Number of cells of each kind code, KIND_CHUNK at a time"""
+        counts = [0] * len(self._kind_classes)
+        n = self.nrows * self.ncols
+        for start in range(0, n, KIND_CHUNK):
+            codes = self._kind_codes(start, min(start + KIND_CHUNK, n))
+            for code in range(len(counts)):
+                counts[code] += codes.count(code)
+        return counts
+
+    def touched(self, index: int) -> Optional[Individual]:
+        """The individual in cell index if it has been made,
+        else None (vulnerable since day 0, of kind kind_of(index))
+        """
+        if self.sparse:
+            return self._individuals.get(index)
+        row, col = divmod(index, self.ncols)
+        return self.cells[row][col]
+
+    def made(self) -> List[int]:
+        """Cells whose individuals have been made, in order"""
+        if self.sparse:
+            return sorted(self._individuals)
+        ncols = self.ncols
+        return [row_i * ncols + col_i
+                for row_i, row in enumerate(self.cells)
+                for col_i, individual in enumerate(row)
+                if individual is not None]
+
+    def materialized(self) -> int:
+        """Number of individuals made so far"""
+        if self.sparse:
+            return len(self._individuals)
+        return sum(len(row) - row.count(None) for row in self.cells)
+
+    def kind_of(self, index: int) -> str:
+        """Kind of the individual in cell index"""
+        return self._kind_classes[self._kinds[index]].__name__
+
+    def _reach(self, index: int) -> Tuple[int, int]:
+        """Number of neighbors and visit distance for cell index"""
+        params = self._code_params[self._kinds[index]]
+        return params.N_Neighbors, params.Visit_Dist
+
+    def _individual(self, index: int) -> Individual:
+        """The individual in cell index, made when first needed"""
+        if self.sparse:
+            individual = self._individuals.get(index)
+            if individual is None:
+                row, col = divmod(index, self.ncols)
+                individual = self._kind_classes[self._kinds[index]](self, row, col)
+                self._individuals[index] = individual
+            return individual
+        row, col = divmod(index, self.ncols)
+        individual = self.cells[row][col]
+        if individual is None:
+            individual = self._kind_classes[self._kinds[index]](self, row, col)
+            self.cells[row][col] = individual
+        return individual
 
     def neighbors(self, num: int, row: int, col: int, dist: int) -> List[Tuple[int, int]]:
-        """Give me addresses of up to num neighbors
-        up to dist away from here(Manhattan distance)
+        """Give me addresses of up to num distinct neighbors
+        up to dist rows and dist columns away from here.
+        Fewer than num only if there are not that many cells
+        in range.
         """
-        result = []
-        count = 0
-        log.debug(f"Cell {row},{col} finding {num} neighbors at distance {dist} " +
-                  f"in {self.nrows},{self.ncols}")
-        attempts = 0
-        while count < num:
-            attempts += 1
-            assert attempts < 1000, (
-                f"Can't find {num} neighbors at distance {dist}")
-            row_step = random.randint(0 - dist, dist)
-            col_step = random.randint(0 - dist, dist)
-            row_addr = row + row_step
-            col_addr = col + col_step
-            # log.debug(f"Trying neighbor at position {row_addr},{col_addr}")
-            if row_addr < 0 or row_addr >= self.nrows:
-                # log.debug("Bad row")
-                continue
-            if col_addr < 0 or col_addr >= self.ncols:
-                # log.debug("Bad column")
-                continue
-            if row_addr == row and col_addr == 0:
-                # log.debug("Can't visit self")
-                continue
-            neighbor_addr = (row_addr, col_addr)
-            if neighbor_addr in result:
-                continue
-            log.debug(f"{row},{col} adding neighbor at {row_addr},{col_addr}")
-            result.append(neighbor_addr)
-            count += 1
-        return result
+        chosen = self.neighbor_table.sample(row, col, num, dist, self.rng)
+        if tracing.NEIGHBORS.enabled:
+            tracing.NEIGHBORS.emit(row, col, chosen)
+        return [divmod(index, self.ncols) for index in chosen]
 
     def visit(self, address: Tuple[int, int]):
         """Who lives there?"""
         row_num, col_num = address
-        return self.cells[row_num][col_num]
+        return self._individual(row_num * self.ncols + col_num)
 
 
 class Typical(Individual):
     """Typical individual. May visit different neighbors
     each day.
     """
+    __slots__ = ()
     def __init__(self, region: Population, row: int, col: int):
         # Much of the constructor has been "factored out" into
         # the abstract base class
@@ -234,10 +642,9 @@ class Typical(Individual):
 
     def social_behavior(self):
         """The way a Typical individual interacts with neighbors"""
-        if random.random() < self.P_Visit:
-            addr = random.choice(self.neighbors)
-            neighbor = self.region.visit(addr)
-            if neighbor.hello(self):
+        if self._random(streams.VISIT) < self.params.P_Visit:
+            neighbor = self._random_neighbor()
+            if neighbor is not None and neighbor.hello(self):
                 neighbor.meet(self)
 
     def hello(self, visitor: "Individual") -> bool:
@@ -248,21 +655,52 @@ class Typical(Individual):
 class AtRisk(Individual):
     """Immunocompromised or elderly.
     Vulnerable and cautious.
+    Whom an AtRisk individual visits depends on every day
+    before, so it remembers the last day it was stepped.
     """
+    __slots__ = ("last_step",)
     def __init__(self, region: "Population", row: int, col: int):
         # Much of the constructor has been "factored out" into
         # the abstract base class
         super().__init__("AtRisk", region, row, col)
+        self.last_step = -1   # Not stepped yet
+
+    def _catch_up(self):
+        """Replay the visits of the days since last_step, on
+        which I was not stepped (see Population, frontier=True).
+        Nobody I could have visited was contagious then, so
+        those visits only move prior_visit along.
+        """
+        region = self.region
+        here = self.row * region.ncols + self.col
+        rng = region.rng
+        p_visit = self.params.P_Visit
+        prior = self.prior_visit
+        prior = None if prior is None else prior.row * region.ncols + prior.col
+        choices = region.neighbor_table.neighbors(here)
+        for day in range(self.last_step + 1, region.day):
+            if rng.uniform(day, here, streams.VISIT) >= p_visit:
+                continue
+            if prior is not None:
+                prior = None
+            elif choices:
+                prior = choices[rng.below(len(choices), day, here, streams.CHOOSE)]
+        self.prior_visit = None if prior is None \
+            else region.visit(divmod(prior, region.ncols))
 
     def social_behavior(self):
         """The way an AtRisk individual interacts with neighbors"""
-        if random.random() >= self.P_Visit:
+        if self.last_step < self.region.day - 1:
+            self._catch_up()
+        self.last_step = self.region.day
+        if self._random(streams.VISIT) >= self.params.P_Visit:
             # No visits today!
             return
         if self.prior_visit is None:
             # Time for someone new
-            addr = random.choice(self.neighbors)
-            neighbor = self.region.visit(addr)
+            neighbor = self._random_neighbor()
+            if neighbor is None:
+                return
             self.prior_visit = neighbor
         else:
             # Second visit to the same person
@@ -273,12 +711,11 @@ class AtRisk(Individual):
 
     def hello(self, visitor: "Individual") -> bool:
         """True means 'welcome' and False means 'go away'"""
-        if (visitor.row, visitor.col) in self.neighbors:
-            return True
-        return False
+        return self._is_neighbor(visitor)
 
 
 class Wanderer(Individual):
+    __slots__ = ()
 
     def __init__(self, region: "Population", row: int, col: int):
         # Much of the constructor has been "factored out" into
@@ -4,10 +4,12 @@ attaching view components to model components and
 communicating events to view components.
 """
 
-from typing import List
+from typing import Dict, List, Sequence
 
 # Event listeners are in the View component
 class Listener:
+    __slots__ = ()
+
     def notify(self, subject: "Listenable", event: str):
         raise NotImplementedError("The 'notify' method must be defined in concrete classes")
 
@@ -16,14 +18,58 @@ class Listener:
 class Listenable:
     """Model components should be listenable, and should notify
     listeners of significant state changes.
+    Components with no listeners share an empty tuple rather
+    than each holding an empty list.
     """
+    __slots__ = ("_listeners",)
 
     def __init__(self):
-        self._listeners: List[Listener] = []
+        self._listeners: Sequence[Listener] = ()
 
     def add_listener(self, listener: Listener):
+        if not self._listeners:
+            self._listeners = []
         self._listeners.append(listener)
 
     def notify_all(self, event: str):
         for listener in self._listeners:
-            listener.notify(self, event)
\ No newline at end of file
+            listener.notify(self, event)
+
+
+# When many similar events happen together (e.g., state changes
+# of many individuals in one time step), it is much cheaper to
+# deliver them together than one at a time.
+
+class BatchListener:
+    __slots__ = ()
+
+    def notify_batch(self, subject: object, event: str, batch: list):
+        raise NotImplementedError("The 'notify_batch' method must be defined in concrete classes")
+
+
+class EventBus:
+    """Listeners subscribe once to a kind of event, and receive
+    all events of that kind from one batch in a single call.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[BatchListener]] = {}
+
+    def subscribe(self, event: str, listener: BatchListener):
+        self._subscribers.setdefault(event, []).append(listener)
+
+    def unsubscribe(self, event: str, listener: BatchListener):
+        subscribers = self._subscribers[event]
+        subscribers.remove(listener)
+        if not subscribers:
+            del self._subscribers[event]
+
+    def has_subscribers(self, event: str) -> bool:
+        return event in self._subscribers
+
+    def publish(self, subject: object, event: str, batch: list):
+        """Deliver a (non-empty) batch of events to each subscriber"""
+        if not batch:
+            return
+        for listener in self._subscribers.get(event, ()):
+            listener.notify_batch(subject, event, batch)
\ No newline at end of file
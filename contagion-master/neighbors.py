@@ -0,0 +1,210 @@
+"""Neighbor tables for a grid population.
+Each individual has a short list of neighbors it may visit.
+Rather than keeping a separate list per individual, all the lists
+are stored in one flat array (compressed sparse row layout):
+the neighbors of cell i are indices[offsets[i]:offsets[i+1]],
+where cells are numbered row * ncols + col.
+
+Neighbors are drawn without replacement from the cells within
+'dist' rows and columns of a cell.  The set of candidate offsets
+depends only on dist and on how close the cell is to each edge
+of the grid, so candidates are enumerated once per such
+'boundary class' and shared.
+
+A LazyNeighborTable holds the same lists, but draws each one only
+when it is first needed.  Draws are keyed by cell (see streams.py),
+so a list is the same whenever it is drawn.
+"""
+
+from array import array
+import sys
+from typing import Callable, Dict, List, Tuple
+
+import streams
+import tracing
+
+
+class NeighborTable:
+    """Neighbor lists for every cell of a grid, added in
+    row-major order.
+    """
+
+    def __init__(self, nrows: int, ncols: int):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.offsets = array("i", [0])
+        self.indices = array("i")
+        # (up, down, left, right) reach -> index offsets of candidates
+        self._candidates: Dict[Tuple[int, int, int, int], List[int]] = {}
+        # Built when first asked who visits a cell
+        self._reverse = None
+
+    def __len__(self) -> int:
+        """Number of cells with neighbor lists"""
+        return len(self.offsets) - 1
+
+    def candidates(self, row: int, col: int, dist: int) -> List[int]:
+        """Index offsets (relative to row * ncols + col) of every
+        cell within dist rows and dist columns, other than the
+        cell itself.  Shared; do not modify.
+        """
+        reach = (min(row, dist), min(self.nrows - 1 - row, dist),
+                 min(col, dist), min(self.ncols - 1 - col, dist))
+        if reach not in self._candidates:
+            up, down, left, right = reach
+            self._candidates[reach] = [
+                d_row * self.ncols + d_col
+                for d_row in range(-up, down + 1)
+                for d_col in range(-left, right + 1)
+                if d_row != 0 or d_col != 0]
+        return self._candidates[reach]
+
+    def sample(self, row: int, col: int, num: int, dist: int,
+               rng: streams.Streams) -> List[int]:
+        """Indices of up to num distinct cells within dist of row, col.
+        Fewer than num only if there are not that many candidates.
+        """
+        choices = self.candidates(row, col, dist)
+        here = row * self.ncols + col
+        return [here + offset for offset in rng.sample(choices, num, here)]
+
+    def append(self, neighbors: List[int]):
+        """Add the neighbor list of the next cell in row-major order"""
+        self.indices.extend(neighbors)
+        self.offsets.append(len(self.indices))
+
+    def neighbors(self, index: int) -> array:
+        """Indices of the neighbors of cell index"""
+        return self.indices[self.offsets[index]:self.offsets[index + 1]]
+
+    def contains(self, index: int, neighbor: int) -> bool:
+        """Is neighbor in the neighbor list of cell index?"""
+        for i in range(self.offsets[index], self.offsets[index + 1]):
+            if self.indices[i] == neighbor:
+                return True
+        return False
+
+    def visitors(self, index: int) -> array:
+        """Indices of the cells that have index as a neighbor"""
+        if self._reverse is None:
+            self._reverse = self.reverse()
+        return self._reverse.neighbors(index)
+
+    def csr(self) -> "NeighborTable":
+        """Every list, in one flat table (this one)"""
+        return self
+
+    def nbytes(self) -> int:
+        """Memory held in the lists"""
+        return (self.offsets.itemsize * len(self.offsets)
+                + self.indices.itemsize * len(self.indices))
+
+    def reverse(self) -> "NeighborTable":
+        """Table of who has each cell as a neighbor: in the
+        result, the neighbors of cell i are the cells that
+        list i as one of their neighbors.
+        """
+        n = len(self)
+        result = NeighborTable(self.nrows, self.ncols)
+        counts = [0] * (n + 1)
+        for index in self.indices:
+            counts[index + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        result.offsets = array("i", counts)
+        result.indices = array("i", bytes(len(self.indices) * result.indices.itemsize))
+        fill = counts[:-1]
+        for cell in range(n):
+            for i in range(self.offsets[cell], self.offsets[cell + 1]):
+                neighbor = self.indices[i]
+                result.indices[fill[neighbor]] = cell
+                fill[neighbor] += 1
+        return result
+
+
+class LazyNeighborTable:
+    """Neighbor lists for every cell of a grid, each drawn
+    the first time it is asked for.  reach(index) gives the
+    number of neighbors and the distance for a cell; max_dist
+    is the largest distance of any cell.
+    """
+
+    def __init__(self, nrows: int, ncols: int,
+                 reach: Callable[[int], Tuple[int, int]], max_dist: int,
+                 rng: streams.Streams):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.reach = reach
+        self.max_dist = max_dist
+        self.rng = rng
+        self._sampler = NeighborTable(nrows, ncols)
+        self._lists: Dict[int, array] = {}
+        self._visitors: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self.nrows * self.ncols
+
+    def candidates(self, row: int, col: int, dist: int) -> List[int]:
+        return self._sampler.candidates(row, col, dist)
+
+    def sample(self, row: int, col: int, num: int, dist: int,
+               rng: streams.Streams) -> List[int]:
+        return self._sampler.sample(row, col, num, dist, rng)
+
+    def _draw(self, index: int) -> List[int]:
+        """The neighbor list of cell index, drawn afresh"""
+        row, col = divmod(index, self.ncols)
+        num, dist = self.reach(index)
+        return self._sampler.sample(row, col, num, dist, self.rng)
+
+    def neighbors(self, index: int) -> array:
+        """Indices of the neighbors of cell index"""
+        chosen = self._lists.get(index)
+        if chosen is None:
+            chosen = array("i", self._draw(index))
+            self._lists[index] = chosen
+            if tracing.NEIGHBORS.enabled:
+                tracing.NEIGHBORS.emit(*divmod(index, self.ncols), list(chosen))
+        return chosen
+
+    def contains(self, index: int, neighbor: int) -> bool:
+        """Is neighbor in the neighbor list of cell index?"""
+        return neighbor in self.neighbors(index)
+
+    def drawn(self) -> List[int]:
+        """Cells whose lists have been drawn, in order"""
+        return sorted(self._lists)
+
+    def keep(self, index: int, chosen: List[int]):
+        """Use chosen as the list of cell index (as restored
+        from a checkpoint, say)
+        """
+        self._lists[index] = array("i", chosen)
+
+    def visitors(self, index: int) -> List[int]:
+        """Indices of the cells that have index as a neighbor.
+        Only cells within max_dist can, so only their lists
+        are drawn.
+        """
+        found = self._visitors.get(index)
+        if found is None:
+            row, col = divmod(index, self.ncols)
+            found = [index + offset for offset in
+                     self._sampler.candidates(row, col, self.max_dist)
+                     if index in self.neighbors(index + offset)]
+            self._visitors[index] = found
+        return found
+
+    def csr(self) -> NeighborTable:
+        """Every list, in one flat table.  Lists not yet drawn
+        are drawn for the table only, and not kept here.
+        """
+        table = NeighborTable(self.nrows, self.ncols)
+        for index in range(len(self)):
+            chosen = self._lists.get(index)
+            table.append(self._draw(index) if chosen is None else chosen)
+        return table
+
+    def nbytes(self) -> int:
+        """Memory held in the lists drawn so far"""
+        return sum(sys.getsizeof(chosen) for chosen in self._lists.values())
@@ -0,0 +1,93 @@
+"""Where does the time go?  Per-phase timing of a simulation run.
+Code to be measured is divided into named phases:
+
+    start = profiling.PROFILER.clock()
+    ...                                      # phase 'step'
+    start = profiling.PROFILER.record("step", start, calls=n)
+
+clock() returns None while profiling is off, and record() returns
+at once when given None, so a phase costs two method calls when
+nobody is looking.  Phases are recorded once per day, never per
+individual.  When on, each phase accumulates wall-clock seconds
+and a call count (e.g. individuals stepped); end_epoch() closes a
+row of the per-epoch table, and table() formats the rows.
+
+Profiling can be switched on and off at any time with enable() and
+disable(); contagion.py also toggles it on SIGUSR1.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Profiler:
+    """Seconds and calls per phase, one row per epoch"""
+
+    def __init__(self):
+        self.enabled = False
+        self._seconds: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        # (epoch, seconds by phase, calls by phase)
+        self.epochs: List[Tuple[int, Dict[str, float], Dict[str, int]]] = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def toggle(self, *_):
+        """Switch on or off (usable as a signal handler)"""
+        self.enabled = not self.enabled
+
+    def clock(self) -> Optional[float]:
+        """Start of a phase, or None if we are not profiling"""
+        if self.enabled:
+            return time.perf_counter()
+        return None
+
+    def record(self, phase: str, start: Optional[float],
+               calls: int = 1) -> Optional[float]:
+        """Charge the time since start to phase; returns the
+        start of the next phase.
+        """
+        if start is None:
+            return None
+        now = time.perf_counter()
+        self._seconds[phase] = self._seconds.get(phase, 0.0) + now - start
+        self._calls[phase] = self._calls.get(phase, 0) + calls
+        return now
+
+    def end_epoch(self, epoch: int):
+        """Close the row for epoch, if anything was recorded"""
+        if self._seconds:
+            self.epochs.append((epoch, self._seconds, self._calls))
+            self._seconds = {}
+            self._calls = {}
+
+    def table(self) -> str:
+        """Milliseconds (and calls) per phase for each epoch"""
+        phases = []
+        for _, seconds, _ in self.epochs:
+            phases.extend(phase for phase in seconds if phase not in phases)
+        if not phases:
+            return "No profile recorded"
+        lines = ["epoch " + " ".join(f"{phase:>22}" for phase in phases)]
+        totals = {phase: 0.0 for phase in phases}
+        total_calls = {phase: 0 for phase in phases}
+        for epoch, seconds, calls in self.epochs:
+            fields = []
+            for phase in phases:
+                ms = seconds.get(phase, 0.0) * 1000
+                n = calls.get(phase, 0)
+                totals[phase] += ms
+                total_calls[phase] += n
+                fields.append(f"{ms:10.1f} ms {n:8}")
+            lines.append(f"{epoch:5} " + " ".join(fields))
+        lines.append("total " + " ".join(
+            f"{totals[phase]:10.1f} ms {total_calls[phase]:8}" for phase in phases))
+        return "\n".join(lines)
+
+
+# The profiler of this process
+PROFILER = Profiler()
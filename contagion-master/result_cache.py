@@ -0,0 +1,265 @@
+"""On-disk cache of simulation results.
+A headless run is fully determined by the configuration, the seed,
+the engine and the model code, so its daily counts can be stored and
+reused.  Entries are named by a hash of
+
+  - every configuration parameter, after DEFAULT inheritance
+    (so two .ini files that say the same thing share entries),
+  - the seed and the engine,
+
+and are filed under the model version: a hash of the source files
+that decide the outcome of a run.  Editing any of them starts a new
+version, and old versions can be removed with invalidate().
+
+The cache is bounded in size.  A running total of the size of its
+entries is kept in a file at the root, so storing an entry does not
+look at the others.  When the total grows past max_bytes, entries of
+old versions are removed, then the least recently used of the
+current version, until the cache is back under EVICT_TO of
+max_bytes; using an entry refreshes its modification time.  Several
+processes may share a cache: entries are written to a temporary
+file and renamed into place, and the total is updated under a lock
+where the platform has one (else it may drift until the next
+eviction recounts it).
+
+Usage:  python3 result_cache.py --stats
+        python3 result_cache.py --invalidate        (all but current)
+        python3 result_cache.py --invalidate VERSION
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+try:
+    import fcntl
+except ImportError:   # Not on Windows
+    fcntl = None
+from typing import Callable, List, Optional, Tuple
+
+import config
+import headless
+import model
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+DEFAULT_ROOT = ".contagion_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Eviction goes down to this fraction of max_bytes, so that
+# it happens once in many puts rather than on every one
+EVICT_TO = 0.9
+# File at the root holding the total size of the entries
+TALLY = "size"
+
+# Sources that decide the outcome of a run
+MODEL_SOURCES = ["model.py", "neighbors.py", "streams.py",
+                 "headless.py", "termination.py", "vector_model.py"]
+
+Series = List[Tuple[int, List[int]]]
+
+_version = None
+
+
+def model_version() -> str:
+    """Hash of the model sources, computed once per process"""
+    global _version
+    if _version is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in MODEL_SOURCES:
+            digest.update(name.encode("utf-8"))
+            with open(os.path.join(here, name), "rb") as source:
+                digest.update(source.read())
+        _version = digest.hexdigest()[:16]
+    return _version
+
+
+def run_key(seed: int, engine: str) -> str:
+    """Hash of the current configuration, seed and engine"""
+    description = {"config": config.resolved(), "seed": seed, "engine": engine}
+    text = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def simulate(seed: int, engine: str = "objects") -> Series:
+    """Daily counts of a headless run in the current configuration"""
+    rows = config.get_int("Grid", "Rows")
+    cols = config.get_int("Grid", "Cols")
+    if engine == "numpy":
+        import vector_model
+        population = vector_model.VectorPopulation(rows, cols, run_seed=seed)
+    else:
+        population = model.Population(rows, cols, run_seed=seed)
+    return list(headless.simulate(population))
+
+
+class ResultCache:
+    """Daily counts of runs, by configuration, seed and engine"""
+
+    def __init__(self, root: str = DEFAULT_ROOT,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 version: Optional[str] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.version = version or model_version()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, self.version, key + ".json")
+
+    def get(self, key: str) -> Optional[Series]:
+        """Stored counts for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as src:
+                entry = json.load(src)
+            os.utime(path)   # Recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [(row[0], row[1:]) for row in entry["series"]]
+
+    def put(self, key: str, series: Series):
+        """Store counts for key, then trim the cache to size"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as out:
+            json.dump({"series": [[day] + counts for day, counts in series]},
+                      out, separators=(",", ":"))
+        size = os.path.getsize(temp)
+        try:
+            size -= os.path.getsize(path)   # Replacing an entry
+        except OSError:
+            pass
+        os.replace(temp, path)
+        if self._tally(size) > self.max_bytes:
+            self.evict()
+
+    def series(self, seed: int, engine: str = "objects",
+               run: Callable[[int, str], Series] = simulate) -> Series:
+        """Counts of the run of seed in the current configuration,
+        from the cache if we have them.
+        """
+        key = run_key(seed, engine)
+        series = self.get(key)
+        if series is None:
+            series = run(seed, engine)
+            self.put(key, series)
+        return series
+
+    def _entries(self, root: Optional[str] = None) -> List[Tuple[float, int, str]]:
+        """(last used, size, path) of every entry under root
+        (default: every version)
+        """
+        entries = []
+        for directory, _, files in os.walk(root or self.root):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue   # Removed by another process
+                entries.append((status.st_mtime, status.st_size, path))
+        return entries
+
+    def _tally(self, change: int = 0, total: Optional[int] = None) -> int:
+        """Add change to the running total size of the entries,
+        or set it to total; return the new total.  A missing or
+        damaged tally is recounted.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, TALLY), "a+") as tally:
+            if fcntl:
+                fcntl.flock(tally, fcntl.LOCK_EX)
+            if total is None:
+                tally.seek(0)
+                try:
+                    total = int(tally.read()) + change
+                except ValueError:
+                    total = sum(size for _, size, _ in self._entries())
+            tally.seek(0)
+            tally.truncate()
+            tally.write(str(total))
+        return total
+
+    def evict(self):
+        """Remove entries of old versions, then least recently
+        used entries, until within EVICT_TO of max_bytes
+        """
+        def order(entry):
+            used, _, path = entry
+            version = os.path.basename(os.path.dirname(path))
+            return version == self.version, used
+
+        entries = sorted(self._entries(), key=order)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= EVICT_TO * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._tally(total=total)
+        for version in self.versions():
+            if version != self.version:
+                try:
+                    os.rmdir(os.path.join(self.root, version))
+                except OSError:
+                    pass   # Still has entries
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def invalidate(self, version: Optional[str] = None):
+        """Remove the entries of version, or if none is given,
+        of every version but the current one.
+        """
+        doomed = [version] if version else \
+            [v for v in self.versions() if v != self.version]
+        for v in doomed:
+            shutil.rmtree(os.path.join(self.root, v), ignore_errors=True)
+            log.info(f"Removed cached results of model version {v}")
+        if doomed:
+            self._tally(total=sum(size for _, size, _ in self._entries()))
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Inspect or clear the contagion result cache")
+    parser.add_argument("--cache", default=DEFAULT_ROOT)
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--invalidate", nargs="?", const="", default=None,
+                        metavar="VERSION",
+                        help="Remove a version (default: all but current)")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    cache = ResultCache(args.cache)
+    if args.invalidate is not None:
+        cache.invalidate(args.invalidate or None)
+    if args.stats or args.invalidate is None:
+        print(f"Current model version {cache.version}")
+        for version in cache.versions():
+            entries = cache._entries(os.path.join(cache.root, version))
+            size = sum(size for _, size, _ in entries)
+            print(f"  {version}: {len(entries)} entries, {size} bytes")
+
+
+if __name__ == "__main__":
+    main()
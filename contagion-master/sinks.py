@@ -0,0 +1,267 @@
+"""Output sinks for daily statistics.
+Each day of a run is one row: the day, the number of individuals
+in each state, then the number in each state for each kind
+(columns named like 'AtRisk_dead').  A sink buffers rows and
+writes them BUFFER_DAYS at a time, so a fast headless run makes
+one write per buffer rather than one per day.
+
+Formats:
+  csv       comma-separated values with a header line
+  ndjson    one JSON object per day
+  columnar  compact binary; each flush is a block holding
+            every column of its rows as 32-bit integers
+            (read it back with read_columnar)
+
+A sink opened with after=day continues an existing file: rows
+for later days (and any row cut short when the last run was
+killed) are dropped and new rows are appended, so resuming from
+a checkpoint of that day leaves one unbroken series.
+"""
+
+from array import array
+import json
+import os
+import struct
+import sys
+from typing import Dict, List, Optional
+
+import model
+from model import Health
+
+# Rows held in memory between writes
+BUFFER_DAYS = 256
+
+COLUMNAR_MAGIC = b"CTGS"
+COLUMNAR_VERSION = 1
+
+
+def columns(kinds: List[str] = model.KINDS) -> List[str]:
+    """Column names of the rows made by record"""
+    names = ["day"] + [str(state) for state in Health]
+    names.extend(f"{kind}_{state}" for kind in kinds for state in Health)
+    return names
+
+
+def record(population, day: int, kinds: List[str] = model.KINDS) -> List[int]:
+    """Today's row: day, counts by state, counts by kind and state"""
+    row = [day]
+    row.extend(population.count_in_state(state) for state in Health)
+    row.extend(population.count_in_state(state, kind)
+               for kind in kinds for state in Health)
+    return row
+
+
+class Sink:
+    """Abstract base class: buffers rows and passes them
+    to _write_rows in bulk.
+    With after=day, keep the rows of an existing file up to
+    that day and append to it.
+    """
+    MODE = "w"
+    APPEND = "a"
+
+    def __init__(self, path: str, names: List[str], buffer: int = BUFFER_DAYS,
+                 after: Optional[int] = None):
+        self.path = path
+        self.columns = names
+        self.buffer = buffer
+        self.rows_written = 0
+        self._rows: List[List[int]] = []
+        if after is not None and os.path.exists(path) and os.path.getsize(path):
+            kept = self._truncate(after)
+            self._out = open(path, self.APPEND)
+            if kept:
+                self._write_rows(kept)
+        else:
+            self._out = open(path, self.MODE)
+            self._write_header()
+
+    def write(self, row: List[int]):
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._write_rows(self._rows)
+            self.rows_written += len(self._rows)
+            self._rows = []
+        self._out.flush()
+
+    def close(self):
+        self.flush()
+        self._out.close()
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_header(self):
+        raise NotImplementedError("_write_header must be defined in concrete classes")
+
+    def _write_rows(self, rows: List[List[int]]):
+        raise NotImplementedError("_write_rows must be defined in concrete classes")
+
+    def _truncate(self, after: int) -> List[List[int]]:
+        """Cut the file after the row for day after; return
+        any rows that were cut but must be written again.
+        """
+        raise NotImplementedError("_truncate must be defined in concrete classes")
+
+
+def _truncate_lines(path: str, after: int, day_of, header: bytes = b""):
+    """Cut a file of one row per line after the row for day after
+    (or at the first line that is incomplete or unreadable)
+    """
+    with open(path, "rb+") as out:
+        if header and out.readline() != header:
+            raise ValueError(f"{path} has other columns than this run")
+        while True:
+            position = out.tell()
+            line = out.readline()
+            if not line:
+                return
+            try:
+                ok = line.endswith(b"\n") and day_of(line) <= after
+            except ValueError:
+                ok = False
+            if not ok:
+                out.truncate(position)
+                return
+
+
+class CSVSink(Sink):
+    def _write_header(self):
+        self._out.write(",".join(self.columns) + "\n")
+
+    def _truncate(self, after: int) -> List[List[int]]:
+        header = (",".join(self.columns) + "\n").encode("utf-8")
+        _truncate_lines(self.path, after,
+                        lambda line: int(line.split(b",", 1)[0]), header)
+        return []
+
+    def _write_rows(self, rows: List[List[int]]):
+        self._out.write("".join(",".join(map(str, row)) + "\n" for row in rows))
+
+
+class NDJSONSink(Sink):
+    def _write_header(self):
+        pass
+
+    def _truncate(self, after: int) -> List[List[int]]:
+        _truncate_lines(self.path, after,
+                        lambda line: int(json.loads(line)["day"]))
+        return []
+
+    def _write_rows(self, rows: List[List[int]]):
+        names = self.columns
+        self._out.write("".join(json.dumps(dict(zip(names, row))) + "\n"
+                                for row in rows))
+
+
+class ColumnarSink(Sink):
+    """Header: magic, version, then the column names (UTF-8,
+    newline separated, length first).  Then one block per flush:
+    the number of rows, then each column in turn.  All integers
+    are little-endian.
+    """
+    MODE = "wb"
+    APPEND = "ab"
+
+    def _write_header(self):
+        names = "\n".join(self.columns).encode("utf-8")
+        self._out.write(struct.pack("<4sHI", COLUMNAR_MAGIC,
+                                    COLUMNAR_VERSION, len(names)))
+        self._out.write(names)
+
+    def _write_rows(self, rows: List[List[int]]):
+        block = array("i")
+        for column in range(len(self.columns)):
+            block.extend(row[column] for row in rows)
+        if sys.byteorder != "little":
+            block.byteswap()
+        self._out.write(struct.pack("<I", len(rows)))
+        self._out.write(block.tobytes())
+
+    def _truncate(self, after: int) -> List[List[int]]:
+        """Whole blocks are kept or cut; the rows kept from
+        the block holding day after are returned to be
+        written again as a shorter block.
+        """
+        width = len(self.columns)
+        with open(self.path, "rb+") as out:
+            header = struct.Struct("<4sHI")
+            magic, version, length = header.unpack(out.read(header.size))
+            names = out.read(length).decode("utf-8").split("\n")
+            if (magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION
+                    or names != self.columns):
+                raise ValueError(f"{self.path} is not a version "
+                                 f"{COLUMNAR_VERSION} columnar series "
+                                 f"with the columns of this run")
+            while True:
+                position = out.tell()
+                size = out.read(4)
+                if not size:
+                    return []
+                block = array("i")
+                if len(size) == 4:
+                    n, = struct.unpack("<I", size)
+                    data = out.read(4 * n * width)
+                    if len(data) == 4 * n * width:
+                        block.frombytes(data)
+                        if sys.byteorder != "little":
+                            block.byteswap()
+                        # Days (the first column) increase
+                        kept = sum(1 for day in block[:n] if day <= after)
+                        if kept == n:
+                            continue
+                        out.truncate(position)
+                        return [[block[column * n + i] for column in range(width)]
+                                for i in range(kept)]
+                out.truncate(position)
+                return []
+
+
+def read_columnar(path: str) -> Dict[str, array]:
+    """Columns of a file written by ColumnarSink, by name"""
+    with open(path, "rb") as src:
+        header = struct.Struct("<4sHI")
+        magic, version, length = header.unpack(src.read(header.size))
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise ValueError(f"{path} is not a version {COLUMNAR_VERSION} "
+                             f"columnar series")
+        names = src.read(length).decode("utf-8").split("\n")
+        result = {name: array("i") for name in names}
+        while True:
+            size = src.read(4)
+            if not size:
+                break
+            n, = struct.unpack("<I", size)
+            block = array("i")
+            block.frombytes(src.read(4 * n * len(names)))
+            if sys.byteorder != "little":
+                block.byteswap()
+            for i, name in enumerate(names):
+                result[name].extend(block[i * n:(i + 1) * n])
+    return result
+
+
+FORMATS = {"csv": CSVSink, "ndjson": NDJSONSink, "columnar": ColumnarSink}
+EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson",
+              ".cols": "columnar", ".bin": "columnar"}
+
+
+def open_sink(path: str, format: Optional[str] = None,
+              kinds: List[str] = model.KINDS,
+              after: Optional[int] = None) -> Sink:
+    """A sink writing to path, in format if given, else
+    as suggested by the file extension (default csv).
+    With after=day, continue the series already in path
+    from the day after that day.
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = EXTENSIONS.get(extension, "csv")
+    return FORMATS[format](path, columns(kinds), after=after)
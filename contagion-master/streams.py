@@ -0,0 +1,103 @@
+"""Reproducible random numbers for contagion runs.
+The model does not draw from one shared sequence of random numbers,
+because then results would depend on the order in which individuals
+are stepped.  Instead each random number is computed from a counter
+naming the draw: the run's seed, the day, the cell, and which draw
+it is for that cell on that day (death roll, visit roll, ...).
+Any given draw has the same value no matter when, in what order,
+or in which process it is computed, so a seed gives the same
+results whether the grid is stepped serially, in tiles, or across
+worker processes.
+
+Values come from the SplitMix64 mixing function applied to
+key + counter * golden-ratio increment, which is the counter'th
+output of a SplitMix64 generator whose state starts at the run key.
+Streams.uniforms computes the same values for an array of cells at
+once; it needs NumPy, which is imported only when it is called.
+"""
+
+import random
+from typing import List, Optional, Sequence
+
+MASK = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+
+# Draws per cell per day; each has its own number.
+KIND = 0                # Which kind of individual (at construction)
+DEATH = 1               # Symptomatic individual dies today?
+VISIT = 2               # Visit someone today?
+CHOOSE = 3              # Which neighbor to visit
+HOST_TRANSMITS = 4      # Host infects visitor (keyed by visitor)
+VISITOR_TRANSMITS = 5   # Visitor infects host (keyed by visitor)
+PATIENT_ZERO = 6        # Where the outbreak starts
+NEIGHBORS = 8           # NEIGHBORS + j: j'th neighbor choice
+DRAWS = 1 << 12
+
+# Day number for draws made while setting up a run
+SETUP = -1
+
+
+def mix(z: int) -> int:
+    """SplitMix64 finalizer: scramble a 64-bit integer"""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+def new_seed() -> int:
+    """A fresh seed, for runs where none is given"""
+    return random.SystemRandom().getrandbits(63)
+
+
+class Streams:
+    """Counter-based random numbers for one run over a grid
+    of 'size' cells.
+    """
+
+    def __init__(self, seed: Optional[int], size: int):
+        self.seed = new_seed() if seed is None else seed
+        self.size = size
+        self.key = mix(self.seed & MASK)
+
+    def counter(self, day: int, cell: int, draw: int) -> int:
+        """Position of a draw in the run's sequence"""
+        return ((day * self.size + cell) * DRAWS + draw) & MASK
+
+    def uniform(self, day: int, cell: int, draw: int) -> float:
+        """Value in [0, 1) for draw on day at cell"""
+        z = mix((self.key + self.counter(day, cell, draw) * GOLDEN) & MASK)
+        return (z >> 11) * (1.0 / (1 << 53))
+
+    def uniforms(self, day: int, cells, draw: int):
+        """uniform(day, cell, draw) for each of cells, a NumPy
+        integer array; returns an array of float64
+        """
+        import numpy as np
+        base = ((day * self.size) * DRAWS + draw) & MASK
+        counter = np.uint64(base) + cells.astype(np.uint64) * np.uint64(DRAWS)
+        z = np.uint64(self.key) + counter * np.uint64(GOLDEN)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+        return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+    def below(self, n: int, day: int, cell: int, draw: int) -> int:
+        """Integer in range(n) for draw on day at cell"""
+        return int(self.uniform(day, cell, draw) * n)
+
+    def sample(self, population: Sequence, k: int, cell: int) -> List:
+        """k distinct elements of population for cell, chosen
+        at setup (partial Fisher-Yates shuffle).  population is
+        not copied: positions swapped so far are kept in a dict,
+        so the cost is in k, not in the size of population.
+        """
+        n = len(population)
+        k = min(k, n)
+        assert NEIGHBORS + k <= DRAWS, f"Can't sample {k} elements"
+        swapped = {}
+        chosen = []
+        for j in range(k):
+            pick = j + self.below(n - j, SETUP, cell, NEIGHBORS + j)
+            chosen.append(population[swapped.get(pick, pick)])
+            swapped[pick] = swapped.get(j, j)
+        return chosen
@@ -0,0 +1,186 @@
+"""Parameter sweeps: sensitivity analysis without editing contagion.ini.
+A sweep starts from a base configuration file and varies some of
+its parameters, each over a list or range of values.  Every
+combination of values (the Cartesian product) is run once per
+seed, in parallel worker processes, and each run is summarized
+as one row of a table with a column per swept parameter.
+
+Parameters are named Section.Parameter; DEFAULT.Parameter sets
+the default for every section that does not override it.
+Values are a comma-separated list, or start:stop:step
+(stop included):
+
+    python3 sweep.py contagion.ini --runs 10 \\
+        --vary Typical.P_Visit=0.3,0.5,0.7 \\
+        --vary DEFAULT.P_Transmit=0.1:0.5:0.1 \\
+        --output sweep.csv
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import config
+import model
+import result_cache
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# A parameter 'Section.Parameter' and the values it takes
+Axis = Tuple[str, List[str]]
+
+# Summary columns of each run
+RESULTS = ["days", "peak_symptomatic", "peak_day",
+           "recovered", "dead", "never_infected"]
+
+
+def parse_values(spec: str) -> List[str]:
+    """Values from 'a,b,c' or 'start:stop:step' (stop included)"""
+    if ":" not in spec:
+        return [value.strip() for value in spec.split(",")]
+    start, stop, step = (float(part) for part in spec.split(":"))
+    if step <= 0:
+        raise ValueError(f"Step must be positive in {spec}")
+    count = int((stop - start) / step + 1e-9) + 1
+    values = [round(start + i * step, 10) for i in range(count)]
+    if all(value == int(value) for value in values):
+        return [str(int(value)) for value in values]
+    return [repr(value) for value in values]
+
+
+def parse_axis(vary: str) -> Axis:
+    """'Section.Parameter=values' as (name, values)"""
+    name, _, spec = vary.partition("=")
+    if "." not in name or not spec:
+        raise ValueError(f"Expected Section.Parameter=values, not {vary}")
+    return name.strip(), parse_values(spec)
+
+
+def points(axes: Sequence[Axis]) -> List[Dict[str, str]]:
+    """Every combination of values of the axes"""
+    names = [name for name, _ in axes]
+    return [dict(zip(names, values))
+            for values in itertools.product(*(values for _, values in axes))]
+
+
+def apply(overrides: Dict[str, str]):
+    """Override the current configuration"""
+    for name, value in overrides.items():
+        section, parameter = name.split(".", 1)
+        config.override(section, parameter, value)
+
+
+def run_point(conf: str, overrides: Dict[str, str], seed: int,
+              engine: str = "objects", cache: Optional[str] = None
+              ) -> Tuple[Dict[str, str], int, List[int]]:
+    """One headless run at one point of the sweep, summarized.
+    Results come from the cache directory, if given, when
+    the same run has been made before.
+    Executed in a worker process, so it configures itself.
+    """
+    config.configure(conf)
+    apply(overrides)
+    if cache:
+        daily = result_cache.ResultCache(cache).series(seed, engine)
+    else:
+        daily = result_cache.simulate(seed, engine)
+    symptomatic = list(model.Health).index(model.Health.symptomatic)
+    peak, peak_day, day, counts = 0, 0, 0, []
+    for day, counts in daily:
+        if counts[symptomatic] > peak:
+            peak, peak_day = counts[symptomatic], day
+    final = dict(zip(model.Health, counts))
+    return overrides, seed, [day, peak, peak_day,
+                             final[model.Health.recovered],
+                             final[model.Health.dead],
+                             final[model.Health.vulnerable]]
+
+
+def run_sweep(conf: str, axes: Sequence[Axis], seeds: Sequence[int],
+              workers: Optional[int] = None, engine: str = "objects",
+              cache: Optional[str] = None) -> Iterator[Tuple[Dict[str, str], int, List[int]]]:
+    """Run every point of the sweep for every seed over a process
+    pool, yielding (point, seed, results) as runs finish.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_point, conf, point, seed, engine, cache)
+                   for point in points(axes) for seed in seeds]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def write_table(out, axes: Sequence[Axis],
+                rows: List[Tuple[Dict[str, str], int, List[int]]]):
+    """One comma-separated line per run, ordered by parameter
+    values (in the order given) and then seed.
+    """
+    names = [name for name, _ in axes]
+    position = {name: {value: i for i, value in enumerate(values)}
+                for name, values in axes}
+    rows = sorted(rows, key=lambda row: (
+        [position[name][row[0][name]] for name in names], row[1]))
+    print(",".join(names + ["seed"] + RESULTS), file=out)
+    for point, seed, results in rows:
+        fields = [point[name] for name in names] + [str(seed)]
+        print(",".join(fields + [str(n) for n in results]), file=out)
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Sweep contagion parameters over ranges of values")
+    parser.add_argument("conf", nargs="?", default="contagion.ini")
+    parser.add_argument("--vary", action="append", default=[],
+                        metavar="Section.Parameter=values",
+                        help="a,b,c or start:stop:step; may be repeated")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Seeds per combination of values")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--engine", choices=["objects", "numpy"],
+                        default="objects")
+    parser.add_argument("--output", default="sweep.csv")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="Reuse results of identical runs stored in DIR")
+    args = parser.parse_args()
+    try:
+        args.axes = [parse_axis(vary) for vary in args.vary]
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+
+def main():
+    args = cli()
+    # Check every parameter against the base configuration
+    # before starting any runs
+    config.configure(args.conf)
+    try:
+        for point in points(args.axes)[:1]:
+            apply(point)
+    except KeyError as error:
+        raise SystemExit(f"Can't vary that parameter: {error}")
+    seeds = range(args.first_seed, args.first_seed + args.runs)
+    total = len(points(args.axes)) * len(seeds)
+    start = time.perf_counter()
+    rows = []
+    for point, seed, results in run_sweep(args.conf, args.axes, seeds,
+                                          args.workers, args.engine,
+                                          args.cache):
+        rows.append((point, seed, results))
+        log.info(f"{point} seed {seed}: {results[0]} days, "
+                 f"{results[4]} dead ({len(rows)}/{total})")
+    with open(args.output, "w") as out:
+        write_table(out, args.axes, rows)
+    elapsed = time.perf_counter() - start
+    print(f"{total} runs in {elapsed:.1f} seconds, "
+          f"table written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""When to stop a run.
+A run ends as soon as any of its criteria is met.  Criteria are
+checked once a day, after the day's step, and see only the day and
+the counts of individuals in each state (in Health order), which the
+population keeps up to date; none of them looks at the grid.
+
+  NoContagious  nobody is asymptomatic or symptomatic.  Nobody can
+                be infected and nobody is ill, so no state can
+                change again: the run is over, on exactly this day.
+  MaxDays       a limit on simulated days.
+  MaxWallTime   a limit on real time.
+  Plateau       the counts have not changed for a window of days.
+"""
+
+import time
+from typing import List, Optional
+
+from model import Health
+
+_STATES = list(Health)
+_CONTAGIOUS = [_STATES.index(Health.asymptomatic),
+               _STATES.index(Health.symptomatic)]
+
+
+class Criterion:
+    """Abstract base class"""
+
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        """Why the run should stop today, or None to go on"""
+        raise NotImplementedError("check must be defined in concrete classes")
+
+
+class NoContagious(Criterion):
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        if all(counts[i] == 0 for i in _CONTAGIOUS):
+            return "no contagious individuals"
+        return None
+
+
+class MaxDays(Criterion):
+    def __init__(self, days: int):
+        self.days = days
+
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        if day >= self.days:
+            return f"reached {self.days} days"
+        return None
+
+
+class MaxWallTime(Criterion):
+    """Time is measured from the first check"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._start = None
+
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        if now - self._start >= self.seconds:
+            return f"ran for {self.seconds:g} seconds"
+        return None
+
+
+class Plateau(Criterion):
+    """Counts identical for window consecutive days"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._last = None
+        self._unchanged = 0
+
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        if counts == self._last:
+            self._unchanged += 1
+        else:
+            self._last = list(counts)
+            self._unchanged = 0
+        if self._unchanged >= self.window:
+            return f"no change for {self.window} days"
+        return None
+
+
+class Termination:
+    """Stop when any of the criteria is met.  The reason
+    is kept in 'reason'.
+    """
+
+    def __init__(self, criteria: List[Criterion]):
+        self.criteria = criteria
+        self.reason: Optional[str] = None
+
+    def check(self, day: int, counts: List[int]) -> Optional[str]:
+        for criterion in self.criteria:
+            reason = criterion.check(day, counts)
+            if reason:
+                self.reason = reason
+                return reason
+        return None
+
+
+def termination(max_days: Optional[int] = None,
+                max_seconds: Optional[float] = None,
+                plateau: Optional[int] = None) -> Termination:
+    """Stop when nobody is contagious, or at any limit given"""
+    criteria: List[Criterion] = [NoContagious()]
+    if max_days is not None:
+        criteria.append(MaxDays(max_days))
+    if max_seconds is not None:
+        criteria.append(MaxWallTime(max_seconds))
+    if plateau is not None:
+        criteria.append(Plateau(plateau))
+    return Termination(criteria)
@@ -0,0 +1,304 @@
+"""Spatial domain decomposition of a VectorPopulation.
+The grid is cut into bands of whole rows ('tiles'), each owned by a
+worker process.  All per-cell arrays live in shared memory
+(multiprocessing.shared_memory), so no array is copied between
+processes.  Each day has two phases, which the coordinating process starts
+in every worker in turn (through a pipe per worker), waiting for
+all workers to finish one before starting the next:
+
+  step:  each worker decides next states for its own cells and makes
+         their visits.  Visits reach at most Visit_Dist rows into the
+         neighboring tiles (the 'halo'); the worker reads halo states
+         straight from the shared state array, and flags halo cells its
+         visitors infect in the shared 'infected' array.
+  tick:  each worker applies the infection flags for its own cells and
+         moves them to their next states, then tallies them.
+
+Nobody writes the state array during the step phase, and each worker
+writes only its own cells during the tick phase, so the halo a worker
+reads is always the whole of yesterday's states.  Random numbers are
+keyed by day and cell (see streams.py), so a tiled run is identical
+to an untiled VectorPopulation run with the same seed.
+
+The coordinator waits on the pipes and on the worker processes
+together, so a worker that fails, or dies without a word, is noticed
+at once: the other workers are stopped, and step() raises TileError.
+
+Strong-scaling benchmark:
+    python3 tiles.py contagion.ini --rows 2000 --cols 2000 --workers 1 2 4
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.connection
+from multiprocessing import shared_memory
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+import vector_model
+from model import Health
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Messages between the coordinating process and a worker
+STEP = 1      # Coordinator: run the step phase
+STEPPED = 2   # Worker: my cells' infections are flagged
+TICK = 3      # Coordinator: run the tick phase
+DONE = 4      # Worker: my cells have moved on a day
+STOP = 0      # Coordinator: exit
+
+# Seconds to wait for workers to exit when closing
+JOIN_TIMEOUT = 5
+
+# (name, shape, dtype) of each shared array
+Layout = List[Tuple[str, Tuple[int, ...], str]]
+
+
+class TileError(RuntimeError):
+    """A worker process failed, so the day can't be finished"""
+
+
+def row_bands(nrows: int, n: int) -> List[Tuple[int, int]]:
+    """Split rows 0..nrows-1 into n nearly equal bands (first, end)"""
+    bounds = [nrows * i // n for i in range(n + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(n)]
+
+
+def _attach(names: Dict[str, str], layout: Layout
+            ) -> Tuple[List[shared_memory.SharedMemory], Dict[str, np.ndarray]]:
+    blocks = []
+    arrays = {}
+    for name, shape, dtype in layout:
+        block = shared_memory.SharedMemory(name=names[name])
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _worker(tile: int, band: Tuple[int, int], rows: int, cols: int,
+            run_seed: int, day: int, names: Dict[str, str], layout: Layout,
+            conn: multiprocessing.connection.Connection):
+    """Owns cells of rows band[0]..band[1]-1, and runs the phases
+    of a day for them as the coordinator asks through conn.
+    """
+    blocks, arrays = _attach(names, layout)
+    population = vector_model.VectorPopulation.from_arrays(
+        rows, cols, run_seed, day, arrays)
+    lo, hi = band[0] * cols, band[1] * cols
+    tallies = arrays["tallies"]
+    try:
+        while conn.recv() == STEP:
+            population.step_cells(lo, hi)
+            conn.send(STEPPED)
+            if conn.recv() != TICK:
+                break
+            population.tick_cells(lo, hi)
+            tallies[tile] = population.tally(lo, hi)
+            population.day += 1
+            conn.send(DONE)
+    except EOFError:
+        pass   # The coordinator has gone
+    except BaseException as error:
+        # Tell the coordinator why, rather than just vanishing
+        try:
+            conn.send(f"{type(error).__name__}: {error}")
+        except OSError:
+            pass
+        raise
+    finally:
+        del population, arrays, tallies
+        for block in blocks:
+            block.close()
+
+
+class TiledPopulation:
+    """A VectorPopulation stepped by worker processes, one per
+    band of rows.  Same interface as VectorPopulation for headless
+    runs; call close() (or use 'with') to stop the workers.
+    """
+
+    def __init__(self, rows: int, cols: int, workers: int,
+                 run_seed: Optional[int] = None):
+        self.nrows = rows
+        self.ncols = cols
+        self.bands = row_bands(rows, min(workers, rows))
+        # Every per-cell array is built in shared memory
+        self._blocks: List[shared_memory.SharedMemory] = []
+        layout: Layout = []
+        names = {}
+
+        def allocate(name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+            dtype = np.dtype(dtype)
+            size = dtype.itemsize * int(np.prod(shape))
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self._blocks.append(block)
+            names[name] = block.name
+            layout.append((name, shape, dtype.str))
+            return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+        try:
+            self.population = vector_model.VectorPopulation(
+                rows, cols, run_seed=run_seed, allocate=allocate)
+            self._tallies = allocate(
+                "tallies", (len(self.bands),) + self.population.tally(0, 0).shape,
+                np.int64)
+        except BaseException:
+            for block in self._blocks:
+                block.unlink()
+            self._blocks = []
+            raise
+        self.rng = self.population.rng
+        # Start one worker per band, each with a pipe to us
+        self._conns: List[multiprocessing.connection.Connection] = []
+        self._workers: List[multiprocessing.Process] = []
+        for tile, band in enumerate(self.bands):
+            ours, theirs = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_worker,
+                args=(tile, band, rows, cols, self.rng.seed,
+                      self.population.day, names, layout, theirs),
+                daemon=True)
+            worker.start()
+            theirs.close()   # So we see EOF if the worker dies
+            self._conns.append(ours)
+            self._workers.append(worker)
+        self._broken: Optional[str] = None
+
+    def _phase(self, command: int, reply: int):
+        """Send command to every worker and wait for each to
+        reply.  Raises TileError (and stops the workers) if any
+        fails or dies instead.
+        """
+        if self._broken:
+            raise TileError(self._broken)
+        try:
+            for conn in self._conns:
+                conn.send(command)
+            waiting = {conn: worker
+                       for conn, worker in zip(self._conns, self._workers)}
+            while waiting:
+                ready = multiprocessing.connection.wait(
+                    list(waiting) + [worker.sentinel for worker in waiting.values()])
+                for conn in list(waiting):
+                    if conn in ready or waiting[conn].sentinel in ready:
+                        # A dead worker's pipe reads as EOF
+                        message = conn.recv()
+                        if message != reply:
+                            raise TileError(f"Tile worker failed: {message}")
+                        del waiting[conn]
+        except (OSError, EOFError):
+            self._fail("A tile worker died")
+        except TileError as error:
+            self._fail(str(error))
+
+    def _fail(self, reason: str):
+        """Stop every worker, and refuse further steps"""
+        self._stop_workers(terminate=True)
+        codes = [worker.exitcode for worker in self._workers]
+        self._broken = f"{reason} (exit codes {codes})"
+        raise TileError(self._broken)
+
+    def _stop_workers(self, terminate: bool = False):
+        for conn in self._conns:
+            try:
+                conn.send(STOP)
+            except OSError:
+                pass   # Already gone
+        for worker in self._workers:
+            if terminate:
+                worker.terminate()
+            worker.join(JOIN_TIMEOUT)
+            if worker.exitcode is None:
+                worker.kill()
+                worker.join()
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+
+    def seed(self):
+        """patient zero (workers are idle between days)"""
+        self.population.seed()
+
+    def step(self):
+        """One day, computed by the workers in parallel"""
+        self._phase(STEP, STEPPED)   # Everyone's infections are flagged
+        self._phase(TICK, DONE)
+        self.population.day += 1
+        self.population._kind_counts = self._tallies.sum(axis=0)
+        self.population._counts = self.population._kind_counts.sum(axis=0)
+
+    def count_in_state(self, state: Health, kind: str = None) -> int:
+        return self.population.count_in_state(state, kind)
+
+    def counts(self) -> dict:
+        return self.population.counts()
+
+    def close(self):
+        """Stop the workers and release shared memory"""
+        if self._conns:
+            self._stop_workers()
+        if self._blocks:
+            del self.population, self._tallies
+            self._release()
+
+    def _release(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> "TiledPopulation":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(rows: int, cols: int, workers: int, days: int,
+              run_seed: int) -> float:
+    """Seconds per simulated day with the given number of workers"""
+    with TiledPopulation(rows, cols, workers, run_seed=run_seed) as population:
+        population.seed()
+        population.step()   # Warm up
+        start = time.perf_counter()
+        for _ in range(days):
+            population.step()
+        return (time.perf_counter() - start) / days
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Strong scaling of the tiled contagion engine")
+    parser.add_argument("conf", nargs="?", default="contagion.ini")
+    parser.add_argument("--rows", type=int, help="Override Grid Rows")
+    parser.add_argument("--cols", type=int, help="Override Grid Cols")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    config.configure(args.conf)
+    rows = args.rows or config.get_int("Grid", "Rows")
+    cols = args.cols or config.get_int("Grid", "Cols")
+    print(f"{rows}x{cols} grid, {args.days} days")
+    print("workers  s/day    speedup  efficiency")
+    base = None
+    for workers in args.workers:
+        per_day = benchmark(rows, cols, workers, args.days, args.seed)
+        if base is None:
+            base = per_day * workers
+        speedup = base / per_day
+        print(f"{workers:7}  {per_day:7.4f}  {speedup:7.2f}  {speedup / workers:9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Trace points: a record of individual events in a run.
+The model announces events (a transmission, a death, ...) at named
+trace points.  A trace point is off unless enabled, and the model
+tests it before doing anything else:
+
+    if tracing.DEATH.enabled:
+        tracing.DEATH.emit(day, row, col)
+
+so an unused trace point costs one attribute test.  An enabled
+point keeps one event in every 1/rate (counting, not random, so
+tracing does not disturb the model's random numbers).  Events are
+stored as raw values in a bounded ring buffer shared by all trace
+points, the oldest dropped first, and are formatted only when the
+buffer is dumped.
+"""
+
+import collections
+import sys
+from typing import Deque, Dict, Iterable, List, TextIO, Tuple
+
+# Events kept in the ring buffer
+CAPACITY = 100_000
+
+# (trace point, values), oldest first
+_buffer: Deque[Tuple["TracePoint", tuple]] = collections.deque(maxlen=CAPACITY)
+
+
+class TracePoint:
+    """A kind of event, with the format of its description"""
+    __slots__ = ("name", "format", "enabled", "_every", "_countdown")
+
+    def __init__(self, name: str, format: str):
+        self.name = name
+        self.format = format
+        self.enabled = False
+        self._every = 1
+        self._countdown = 1
+
+    def enable(self, rate: float = 1.0):
+        """Keep about rate (0 < rate <= 1) of these events"""
+        assert 0 < rate <= 1, f"Trace rate must be in (0, 1], not {rate}"
+        self._every = max(1, round(1 / rate))
+        self._countdown = 1
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def emit(self, *values):
+        """Record an event; values fill in the format"""
+        self._countdown -= 1
+        if self._countdown == 0:
+            self._countdown = self._every
+            _buffer.append((self, values))
+
+    def describe(self, values: tuple) -> str:
+        return f"{self.name}: " + self.format.format(*values)
+
+
+TRANSMISSION = TracePoint("transmission", "day {0}: {1},{2} infects {3},{4}")
+SYMPTOMATIC = TracePoint("symptomatic", "day {0}: {1},{2} becomes symptomatic")
+RECOVERY = TracePoint("recovery", "day {0}: {1},{2} recovers")
+DEATH = TracePoint("death", "day {0}: {1},{2} dies")
+NEIGHBORS = TracePoint("neighbors", "{0},{1} may visit {2}")
+
+POINTS: Dict[str, TracePoint] = {point.name: point for point in
+                                 [TRANSMISSION, SYMPTOMATIC, RECOVERY,
+                                  DEATH, NEIGHBORS]}
+
+
+def set_capacity(capacity: int):
+    """Keep at most capacity events (the most recent)"""
+    global _buffer
+    _buffer = collections.deque(_buffer, maxlen=capacity)
+
+
+def enable(specs: Iterable[str]):
+    """Enable trace points given as 'name' or 'name:rate';
+    'all' enables every trace point.
+    """
+    for spec in specs:
+        name, _, rate = spec.partition(":")
+        points = POINTS.values() if name == "all" else [POINTS[name]]
+        for point in points:
+            point.enable(float(rate) if rate else 1.0)
+
+
+def disable_all():
+    for point in POINTS.values():
+        point.disable()
+
+
+def events() -> List[str]:
+    """Descriptions of the buffered events, oldest first"""
+    return [point.describe(values) for point, values in list(_buffer)]
+
+
+def dump(out: TextIO = sys.stderr, clear: bool = True):
+    """Write the buffered events, and by default empty the buffer"""
+    for line in events():
+        print(line, file=out)
+    if clear:
+        _buffer.clear()
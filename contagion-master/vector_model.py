@@ -0,0 +1,304 @@
+"""Array-based ("struct of arrays") engine for the contagion model.
+Instead of one Individual object per cell, the population is a
+handful of NumPy arrays indexed by cell number (row * ncols + col):
+state, time in state, kind, the per-kind parameters, and neighbor
+tables.  Each day is computed with whole-array operations that
+follow the same rules as Individual.step and Individual.tick in
+model.py, so the two engines are interchangeable for headless runs.
+
+Random numbers are the same counter-based draws as in model.py
+(see streams.py), computed for many cells at once.  Given the same
+seed, a VectorPopulation makes the same choices as a model.Population
+stepped with frontier=False, and its results do not depend on how
+the arrays are split up.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+import config
+import neighbors
+import streams
+from model import Health, KindParams, kind_thresholds
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.WARN)
+
+# Integer codes for states, as stored in the state arrays
+VULNERABLE = Health.vulnerable.value
+ASYMPTOMATIC = Health.asymptomatic.value
+SYMPTOMATIC = Health.symptomatic.value
+RECOVERED = Health.recovered.value
+DEAD = Health.dead.value
+
+# Integer codes for kinds of individual
+KINDS = ["Typical", "AtRisk"]
+TYPICAL = KINDS.index("Typical")
+ATRISK = KINDS.index("AtRisk")
+
+NO_NEIGHBOR = -1
+
+# Cells filled at a time while building a population, which
+# bounds the size of temporary arrays
+BAND = 1 << 16
+
+# allocate(name, shape, dtype): an uninitialized array
+Allocator = Callable[[str, Tuple[int, ...], np.dtype], np.ndarray]
+
+
+def _allocate(name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    return np.empty(shape, dtype=dtype)
+
+
+class VectorPopulation:
+    """Grid of individuals held as parallel arrays.
+    Public interface matches what headless runs use from
+    model.Population: nrows, ncols, seed, step, count_in_state, counts.
+
+    A day is computed in two phases, each of which can be applied
+    to any range of cells: step_cells decides next states for the
+    cells in a range and flags whoever they infect (possibly outside
+    the range), then tick_cells applies infections and moves the
+    cells in a range to their next states.  The tiles module runs
+    these phases for different ranges in different processes.
+    """
+
+    # Arrays with one entry (or row) per cell
+    ARRAYS = ["kind", "T_Incubate", "P_Transmit", "T_Recover", "P_Death",
+              "P_Visit", "state", "next_state", "time_in_state",
+              "prior_visit", "infected", "neighbors", "n_neighbors"]
+
+    def __init__(self, rows: int, cols: int, run_seed: Optional[int] = None,
+                 allocate: Allocator = _allocate):
+        """Each of ARRAYS is made by allocate and filled in place,
+        BAND cells at a time, so that tiles.py can build a
+        population straight into shared memory.
+        """
+        self.nrows = rows
+        self.ncols = cols
+        self.size = rows * cols
+        self.rng = streams.Streams(run_seed, self.size)
+        self.day = 0
+        self.kind = allocate("kind", (self.size,), np.int8)
+        self._random_kinds()
+        self.params = [KindParams(kind) for kind in KINDS]
+        # Per-kind parameters, expanded to one entry per cell
+        for name in ["T_Incubate", "P_Transmit", "T_Recover", "P_Death", "P_Visit"]:
+            by_kind = np.array([getattr(params, name) for params in self.params])
+            array = allocate(name, (self.size,), by_kind.dtype)
+            np.take(by_kind, self.kind, out=array)
+            setattr(self, name, array)
+        # Initially everyone is vulnerable
+        self.state = allocate("state", (self.size,), np.int8)
+        self.state.fill(VULNERABLE)
+        self.next_state = allocate("next_state", (self.size,), np.int8)
+        self.next_state.fill(VULNERABLE)
+        self.time_in_state = allocate("time_in_state", (self.size,), np.int32)
+        self.time_in_state.fill(0)
+        # AtRisk individuals alternate new visits and return visits
+        self.prior_visit = allocate("prior_visit", (self.size,), np.int32)
+        self.prior_visit.fill(NO_NEIGHBOR)
+        # Infected during the current day's step phase
+        self.infected = allocate("infected", (self.size,), np.uint8)
+        self.infected.fill(0)
+        width = max(params.N_Neighbors for params in self.params)
+        self.neighbors = allocate("neighbors", (self.size, width), np.int32)
+        self.neighbors.fill(NO_NEIGHBOR)
+        self.n_neighbors = allocate("n_neighbors", (self.size,), np.int32)
+        self.n_neighbors.fill(0)
+        for lo in range(0, self.size, BAND):
+            self._fill_neighbors(lo, min(lo + BAND, self.size))
+        self._count_states()
+
+    @classmethod
+    def from_arrays(cls, rows: int, cols: int, run_seed: int, day: int,
+                    arrays: Dict[str, np.ndarray]) -> "VectorPopulation":
+        """A population over existing arrays (e.g., in shared
+        memory), named as in ARRAYS.
+        """
+        population = cls.__new__(cls)
+        population.nrows = rows
+        population.ncols = cols
+        population.size = rows * cols
+        population.rng = streams.Streams(run_seed, population.size)
+        population.day = day
+        for name in cls.ARRAYS:
+            setattr(population, name, arrays[name])
+        return population
+
+    def _random_kinds(self):
+        """Fill kind, making the same choice as model.Population"""
+        (_, atrisk_below), _ = kind_thresholds(
+            [(ATRISK, config.get_float("Grid", "Proportion_AtRisk")),
+             (TYPICAL, config.get_float("Grid", "Proportion_Typical"))])
+        for lo in range(0, self.size, BAND):
+            hi = min(lo + BAND, self.size)
+            dice = self.rng.uniforms(streams.SETUP, np.arange(lo, hi), streams.KIND)
+            self.kind[lo:hi] = np.where(dice < atrisk_below, ATRISK, TYPICAL)
+
+    def _fill_neighbors(self, lo: int, hi: int):
+        """Up to N_Neighbors distinct cells within Visit_Dist
+        (in each direction) of each of cells lo..hi-1, as rows of
+        the neighbors array padded with NO_NEIGHBOR, plus the count
+        in each row (n_neighbors).  Chosen as
+        neighbors.NeighborTable.sample chooses them, by a partial
+        shuffle of the candidates for the cell's boundary class;
+        all cells of a class are shuffled together.
+        """
+        grid = neighbors.NeighborTable(self.nrows, self.ncols)
+        counts = [params.N_Neighbors for params in self.params]
+        table = self.neighbors
+        n_neighbors = self.n_neighbors
+        for code, params in enumerate(self.params):
+            cells = lo + np.flatnonzero(self.kind[lo:hi] == code)
+            if len(cells) == 0:
+                continue
+            num = counts[code]
+            dist = params.Visit_Dist
+            rows, cols = cells // self.ncols, cells % self.ncols
+            reach = np.stack([np.minimum(rows, dist),
+                              np.minimum(self.nrows - 1 - rows, dist),
+                              np.minimum(cols, dist),
+                              np.minimum(self.ncols - 1 - cols, dist)], axis=1)
+            _, boundary_class = np.unique(reach, axis=0, return_inverse=True)
+            boundary_class = boundary_class.ravel()
+            for members in range(boundary_class.max() + 1):
+                group = cells[boundary_class == members]
+                row, col = divmod(int(group[0]), self.ncols)
+                choices = np.array(grid.candidates(row, col, dist), dtype=np.int64)
+                pool = np.tile(choices, (len(group), 1))
+                which = np.arange(len(group))
+                take = min(num, len(choices))
+                for j in range(take):
+                    dice = self.rng.uniforms(streams.SETUP, group, streams.NEIGHBORS + j)
+                    pick = j + (dice * (len(choices) - j)).astype(np.int64)
+                    mine = pool[which, j].copy()
+                    pool[which, j] = pool[which, pick]
+                    pool[which, pick] = mine
+                table[group, :take] = group[:, None] + pool[:, :take]
+                n_neighbors[group] = take
+
+    def seed(self):
+        """patient zero"""
+        cell = self.rng.below(self.size, streams.SETUP, 0, streams.PATIENT_ZERO)
+        if self.state[cell] == VULNERABLE:
+            self.state[cell] = ASYMPTOMATIC
+            self.next_state[cell] = ASYMPTOMATIC
+            self.time_in_state[cell] = 0
+            self._count_states()
+
+    def step(self):
+        """One day: determine next states, then time passes"""
+        self.step_cells(0, self.size)
+        self.tick_cells(0, self.size)
+        self.day += 1
+        self._count_states()
+
+    def step_cells(self, lo: int, hi: int):
+        """Step phase for cells lo..hi-1: incubation, recovery and
+        death, then visits and two-way maybe_transmit for each
+        visit they make.  Reads today's states anywhere in the grid;
+        writes next_state and prior_visit only in lo..hi-1, and
+        infected flags for anyone.
+        """
+        cells = np.arange(lo, hi)
+        self._progress(lo, hi, cells)
+        self._visits(lo, hi, cells)
+
+    def _progress(self, lo: int, hi: int, cells: np.ndarray):
+        """Incubation, recovery and death (Individual.step)"""
+        state = self.state[lo:hi]
+        t = self.time_in_state[lo:hi]
+        next_state = self.next_state[lo:hi]
+        incubated = (state == ASYMPTOMATIC) & (t > self.T_Incubate[lo:hi])
+        next_state[incubated] = SYMPTOMATIC
+        sick = state == SYMPTOMATIC
+        recovered = sick & (t > self.T_Recover[lo:hi])
+        next_state[recovered] = RECOVERED
+        dice = self.rng.uniforms(self.day, cells, streams.DEATH)
+        died = sick & ~recovered & (dice < self.P_Death[lo:hi])
+        next_state[died] = DEAD
+
+    def _visits(self, lo: int, hi: int, cells: np.ndarray):
+        """Social behavior of Typical and AtRisk individuals,
+        followed by two-way maybe_transmit for each welcome visit.
+        """
+        has_neighbors = self.n_neighbors[lo:hi] > 0
+        dice = self.rng.uniforms(self.day, cells, streams.VISIT)
+        visitors = cells[has_neighbors & (dice < self.P_Visit[lo:hi])]
+        # Pick a random neighbor for each visitor
+        picks = (self.rng.uniforms(self.day, visitors, streams.CHOOSE)
+                 * self.n_neighbors[visitors]).astype(np.int32)
+        hosts = self.neighbors[visitors, picks]
+        # AtRisk visitors alternate between someone new and a
+        # second visit to the person they saw last time
+        at_risk = self.kind[visitors] == ATRISK
+        prior = self.prior_visit[visitors]
+        returning = at_risk & (prior != NO_NEIGHBOR)
+        hosts = np.where(returning, prior, hosts)
+        self.prior_visit[visitors[at_risk]] = np.where(
+            returning[at_risk], NO_NEIGHBOR, hosts[at_risk])
+        # AtRisk hosts only welcome their own neighbors
+        guarded = self.kind[hosts] == ATRISK
+        known = (self.neighbors[hosts] == visitors[:, None]).any(axis=1)
+        welcome = ~guarded | known
+        visitors, hosts = visitors[welcome], hosts[welcome]
+        # Either may infect the other, judged on today's states,
+        # with the visitor's dice
+        self._maybe_transmit(hosts, visitors, visitors, streams.HOST_TRANSMITS)
+        self._maybe_transmit(visitors, hosts, visitors, streams.VISITOR_TRANSMITS)
+
+    def _maybe_transmit(self, sources: np.ndarray, targets: np.ndarray,
+                        visitors: np.ndarray, draw: int):
+        contagious = ((self.state[sources] == ASYMPTOMATIC)
+                      | (self.state[sources] == SYMPTOMATIC))
+        vulnerable = self.state[targets] == VULNERABLE
+        dice = self.rng.uniforms(self.day, visitors, draw)
+        infected = contagious & vulnerable & (dice < self.P_Transmit[sources])
+        self.infected[targets[infected]] = 1
+
+    def tick_cells(self, lo: int, hi: int):
+        """Tick phase for cells lo..hi-1: infections flagged in the
+        step phase take effect, and time passes (Individual.tick).
+        """
+        state = self.state[lo:hi]
+        next_state = self.next_state[lo:hi]
+        t = self.time_in_state[lo:hi]
+        infected = self.infected[lo:hi]
+        # Only vulnerable individuals are ever flagged
+        next_state[infected != 0] = ASYMPTOMATIC
+        infected[:] = 0
+        t += 1
+        changed = state != next_state
+        state[changed] = next_state[changed]
+        t[changed] = 0
+
+    def tally(self, lo: int, hi: int) -> np.ndarray:
+        """Count of cells lo..hi-1 by kind (rows) and state (columns)"""
+        n_states = max(h.value for h in Health) + 1
+        tally = np.bincount(self.kind[lo:hi].astype(np.int32) * n_states
+                            + self.state[lo:hi],
+                            minlength=len(KINDS) * n_states)
+        return tally.reshape(len(KINDS), n_states)
+
+    def _count_states(self):
+        """Tally states by kind once per day, so that counting
+        queries do not each scan the arrays.
+        """
+        self._kind_counts = self.tally(0, self.size)
+        self._counts = self._kind_counts.sum(axis=0)
+
+    def count_in_state(self, state: Health, kind: str = None) -> int:
+        """How many individuals (of kind, if given) are currently in state?"""
+        if kind is None:
+            return int(self._counts[state.value])
+        if kind not in KINDS:
+            return 0
+        return int(self._kind_counts[KINDS.index(kind), state.value])
+
+    def counts(self) -> dict:
+        """Current number of individuals in each state"""
+        return {state: int(self._counts[state.value]) for state in Health}